@@ -2,43 +2,59 @@
 Admit Card Generator - Automated batch processing of admit cards from CSV data
 
 TIME COMPLEXITY ANALYSIS:
-- to_roman(num): O(1) - Fixed iterations for numbers 1-10
+- prepare_cards(): O(n) vectorised - strings and filenames built per CSV chunk
 - load_coordinates(): O(1) - Reading fixed 8 fields from JSON
 - save_coordinates(): O(1) - Writing fixed 8 fields to JSON
 - find_coordinates(): O(1) - Interactive, not dependent on data size
 - generate_admit_cards(): O(n/w) with multithreading where:
   * n = number of students
-  * w = number of worker threads
+  * w = number of worker threads (or processes with the "process" backend)
   Overall: O(n) - Linear with number of students (parallelized)
 
 SPACE COMPLEXITY ANALYSIS:
 - coordinates: O(1) - Fixed 8 field coordinates
 - text_sizes: O(1) - Fixed 8 field sizes
-- data (DataFrame): O(n * f) - Stores all student records
-- Image processing: O(w * h * workers) - Template per thread
+- data (DataFrame): O(c * f) - Only the CSV chunks in the read-ahead queue
+- Image processing: O(w * h * workers) - One decoded template per process,
+  plus one working copy per thread
 - Output files: O(n * w * h) - One image per student
   Overall: O(n) - Linear with number of students
 
 IMPROVEMENTS:
 - Configuration file for easy customization
 - Multi-threading for 3-4x faster generation
+- Process-pool backend for near-linear scaling on many-core machines
+- LRU cache of rendered text for fields that repeat across the roster
+- Optional glyph-atlas text engine (NumPy) for values unique to each card
+- Dirty-rectangle mode that draws only the field regions of each card
+- Incremental JPEG encoder that re-encodes only the MCU rows holding text
+- Vector PDF mode: one shared template image plus real text for every page
+- Streaming PDF assembly: pages are appended in roster order while cards render
+- Chunked CSV streaming: the roster is never fully loaded into memory
+- Columnar pre-formatting: draw strings and filenames are built per chunk, workers get plain tuples
+- Bounded in-flight window: only a few tasks are queued ahead of the workers
+- Incremental runs: a content-hash manifest skips cards that have not changed
+- Checkpoint journal and atomic writes: an interrupted run continues with --resume
+- Sharded output folders (by roll prefix or hash), found through the manifest rather than the disk
+- Palette and bilevel colour modes: quantised template, palette PNG or CCITT G4 TIFF cards
 - Preview mode to test before batch processing
 """
 
 import pandas as pd
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageFont, ImageColor
 import os
-import matplotlib.pyplot as plt
-import matplotlib.image as mpimg
 import json
-from tqdm import tqdm
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed, wait, FIRST_COMPLETED
+import threading
+import queue
 import time
-try:
-    import img2pdf
-    PDF_SUPPORT = True
-except ImportError:
-    PDF_SUPPORT = False
+import io
+from pdf_writer import PDFWriter, OrderedPageSink, EmbeddedTrueTypeFont, PX_TO_PT
+from roster import prepare_cards, sanitize_filename, sanitize_filenames, RosterValidator, RosterIndex
+from manifest import OutputManifest, CheckpointJournal, render_fingerprint, card_digest, card_path, list_output_files, card_temp_files
+from renderer import AdmitCardRenderer, compile_render_plan, load_template, output_extension, init_process_worker, render_chunk, encode_chunk
+from archive_writer import ZipVolumeSink
+import sys
 
 # Load configuration
 def load_config():
@@ -69,49 +85,100 @@ FONT_SIZE = config['font']['size']
 FONT_COLOR = config['font']['color']
 
 field_names = config['fields']
-text_sizes = {k: tuple(v) for k, v in config['text_sizes'].items()}
 
 ENABLE_MULTITHREADING = config['performance']['enable_multithreading']
 MAX_WORKERS = config['performance']['max_workers']
+RENDER_BACKEND = config['performance'].get('backend', 'thread')  # "thread" or "process"
+CHUNK_SIZE = config['performance'].get('chunk_size', 64)  # Rows per task for the process backend
+CSV_CHUNK_SIZE = config['performance'].get('csv_chunk_size', 10000)  # Rows per CSV read
+CSV_QUEUE_SIZE = config['performance'].get('csv_queue_size', 4)  # CSV chunks read ahead of the renderer
+MAX_IN_FLIGHT = config['performance'].get('max_in_flight', MAX_WORKERS * 4)  # Outstanding tasks per pool
 
 PREVIEW_ENABLED = config['preview']['enabled']
 PREVIEW_COUNT = config['preview']['preview_count']
 
 GENERATE_PDF = config['output'].get('generate_pdf', False)
 PDF_FILENAME = config['output'].get('pdf_filename', 'admit_cards.pdf')
+PDF_MODE = config['output'].get('pdf_mode', 'images')  # "images" (card files) or "vector"
+# ZIP archive output: cards are streamed into stored ZIP volumes instead of loose files
+ARCHIVE_ENABLED = config['output'].get('archive', {}).get('enabled', False)
+ARCHIVE_FILENAME = config['output'].get('archive', {}).get('filename', 'admit_cards.zip')
+ARCHIVE_SPLIT = config['output'].get('archive', {}).get('split_by', 'none')  # "none", "size" or "course"
+ARCHIVE_VOLUME_MB = config['output'].get('archive', {}).get('max_volume_mb', 1024)
+# Card folder layout: "flat", or sharded by roll prefix ("prefix", CS/2021/) or filename hash ("hash")
+OUTPUT_LAYOUT = config['output'].get('layout', 'flat')
+INCREMENTAL = config['output'].get('incremental', True)  # Skip cards unchanged since the last run
+MANIFEST_FILE = config['output'].get('manifest_file', 'manifest.json')  # Also the index of the card files
+CHECKPOINT_FILE = config['output'].get('checkpoint_file', 'checkpoint.jsonl')  # Cards finished by the current run
 
 # Image optimization settings
 OPTIMIZE_IMAGES = config.get('optimization', {}).get('enabled', True)
 IMAGE_QUALITY = config.get('optimization', {}).get('quality', 85)  # 1-100, 85 is good balance
 COMPRESS_LEVEL = config.get('optimization', {}).get('compress_level', 6)  # 0-9 for PNG
+# "rgb", "palette" (quantised template, palette PNG) or "bilevel" (1-bit template, CCITT G4 TIFF)
+COLOR_MODE = config.get('optimization', {}).get('color_mode', 'rgb')
+PALETTE_COLORS = config.get('optimization', {}).get('palette_colors', 16)
+BILEVEL_THRESHOLD = config.get('optimization', {}).get('threshold', 128)  # Grey level from which a pixel is white
 
-# Dry run mode
-DRY_RUN = False
+# Column formatters by field (see roster.FORMATTERS), e.g. semester -> Roman numerals
+FIELD_FORMATS = config.get('formats', {'semester': 'roman'})
 
+# Whole-roster validation rules (Validate mode)
+SEMESTER_RANGE = config.get('validation', {}).get('semester_range', [1, 10])
+DOB_FORMAT = config.get('validation', {}).get('dob_format', '%d/%m/%Y')
+APAAR_LENGTH = config.get('validation', {}).get('apaar_length', 12)
+VALIDATION_REPORT = config.get('validation', {}).get('report_file', 'validation_report.json')
 
-# Validate and load data from CSV
+
+# Validate the CSV; rows are streamed in chunks when needed
 def load_and_validate_data():
-    """Load CSV and validate required columns exist."""
+    """Validate required columns exist (reads the CSV header only)."""
     try:
-        data = pd.read_csv(DataFileName)
-        missing_cols = [col for col in field_names if col not in data.columns]
+        columns = pd.read_csv(DataFileName, nrows=0).columns
+        missing_cols = [col for col in field_names if col not in columns]
         if missing_cols:
             print(f"ERROR: Missing columns in CSV: {missing_cols}")
             print(f"Required columns: {field_names}")
-            return None
-        print(f"✓ Loaded {len(data)} students from CSV")
-        return data
+            return False
+        print(f"✓ CSV validated: {DataFileName}")
+        return True
     except FileNotFoundError:
         print(f"ERROR: CSV file not found: {DataFileName}")
-        return None
+        return False
     except Exception as e:
         print(f"ERROR loading CSV: {e}")
-        return None
+        return False
+
+def read_csv(nrows=None, chunksize=None):
+    """Read only the configured columns, all as strings."""
+    return pd.read_csv(DataFileName, usecols=field_names, dtype={field: str for field in field_names},
+                       nrows=nrows, chunksize=chunksize)
+
+def stream_chunks():
+    """Yield CSV chunks read ahead by a background thread through a bounded queue."""
+    chunks = queue.Queue(maxsize=CSV_QUEUE_SIZE)
+    
+    def reader():
+        try:
+            for chunk in read_csv(chunksize=CSV_CHUNK_SIZE):
+                chunks.put(chunk)
+            chunks.put(None)
+        except Exception as e:
+            chunks.put(e)
+    
+    threading.Thread(target=reader, daemon=True).start()
+    while True:
+        chunk = chunks.get()
+        if chunk is None:
+            return
+        if isinstance(chunk, Exception):
+            raise chunk
+        yield chunk
 
-data = load_and_validate_data()
-if data is None:
-    print("Exiting due to data loading error")
-    exit(1)
+def iter_prepared():
+    """Yield (cards, failures) per streamed CSV chunk, see roster.prepare_cards()."""
+    for chunk in stream_chunks():
+        yield prepare_cards(chunk, field_names, FIELD_FORMATS)
 
 
 # Store coordinates
@@ -121,20 +188,6 @@ coordinates = {}
 current_field_index = [0]
 captured_coords = {}
 
-def to_roman(num):
-    """Convert number to Roman numeral."""
-    val = [10, 9, 5, 4, 1]
-    syms = ['X', 'IX', 'V', 'IV', 'I']
-    roman = ''
-    i = 0
-    num = int(num)
-    while num > 0:
-        for _ in range(num // val[i]):
-            roman += syms[i]
-            num -= val[i]
-        i += 1
-    return roman
-
 def save_coordinates():
     """Save coordinates to JSON file."""
     with open(COORDINATES_FILE, 'w') as f:
@@ -186,6 +239,9 @@ def find_coordinates():
     print("- Press 'U' to undo last coordinate")
     print()
     
+    # Only this mode needs matplotlib, import it here to keep startup fast
+    import matplotlib.pyplot as plt
+    import matplotlib.image as mpimg
     img = mpimg.imread(Imagefilename)
     fig, ax = plt.subplots(figsize=(12, 8))
     ax.imshow(img)
@@ -227,79 +283,33 @@ if saved_coords:
     print("✓ Loaded saved coordinates")
 
 
-def sanitize_filename(filename):
-    """Sanitize filename to prevent path traversal and remove special characters."""
-    import re
-    # Remove path separators and special characters
-    filename = str(filename)
-    # Remove any path components
-    filename = os.path.basename(filename)
-    # Remove special characters, keep only alphanumeric, spaces, hyphens, underscores
-    filename = re.sub(r'[^a-zA-Z0-9\s\-_.]', '_', filename)
-    # Remove leading/trailing spaces and dots
-    filename = filename.strip('. ')
-    # Limit length
-    if len(filename) > 200:
-        filename = filename[:200]
-    # Ensure not empty
-    if not filename:
-        filename = 'unnamed'
-    return filename
-
-def generate_single_card(row, template_path, font, dry_run=False):
-    """Generate a single admit card (thread-safe by reloading template)."""
-    try:
-        # Validate data first
-        for field in field_names:
-            if field not in row or pd.isna(row[field]):
-                return (False, row.get('name', 'Unknown'), f"Missing field: {field}")
-        
-        if dry_run:
-            # Dry run - validate only, don't save
-            safe_filename = sanitize_filename(row['roll no.'])
-            return (True, row.get('name', 'Unknown'), f"Would create: {safe_filename}.png")
-        
-        # Load fresh template for each card (thread-safe)
-        img = Image.open(template_path)
-        draw = ImageDraw.Draw(img)
-        
-        # Write student data
-        for field in field_names:
-            if field in coordinates:
-                x, y = coordinates[field]
-                value = to_roman(row[field]) if field == 'semester' else str(row[field])
-                draw.text((x, y), value, font=font, fill=FONT_COLOR)
-        
-        # Sanitize filename for security
-        safe_filename = sanitize_filename(row['roll no.'])
-        output_file = os.path.join(Output_path, f"{safe_filename}.png")
-        
-        # Verify output path is within allowed directory (prevent path traversal)
-        output_file = os.path.abspath(output_file)
-        output_dir = os.path.abspath(Output_path)
-        if not output_file.startswith(output_dir):
-            return (False, row.get('name', 'Unknown'), "Path traversal attempt detected")
-        
-        # Save with optimization
-        if OPTIMIZE_IMAGES:
-            # Convert to RGB if needed (removes alpha channel)
-            if img.mode in ('RGBA', 'LA', 'P'):
-                rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-                if img.mode == 'P':
-                    img = img.convert('RGBA')
-                rgb_img.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                img = rgb_img
-            
-            # Save as JPEG with quality setting (much smaller than PNG)
-            output_file = output_file.replace('.png', '.jpg')
-            img.save(output_file, 'JPEG', quality=IMAGE_QUALITY, optimize=True)
-        else:
-            # Save as PNG with compression
-            img.save(output_file, 'PNG', compress_level=COMPRESS_LEVEL, optimize=True)
-        
-        return (True, row.get('name', 'Unknown'), None)
-    except Exception as e:
-        return (False, row.get('name', 'Unknown'), str(e))
+def run_windowed(submit, items, max_in_flight):
+    """Submit items with at most max_in_flight futures outstanding.
+
+    submit(item) returns a future. Yields (item, future) as futures complete;
+    both are released by the time the caller asks for the next one.
+    """
+    pending = {}
+    for item in items:
+        if len(pending) >= max_in_flight:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield pending.pop(future), future
+        pending[submit(item)] = item
+    
+    for future in as_completed(list(pending)):
+        yield pending.pop(future), future
+
+def batched(items, size):
+    """Yield lists of up to size items."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 
 def preview_admit_card():
@@ -312,42 +322,80 @@ def preview_admit_card():
         return False
     
     try:
-        font = ImageFont.truetype(FONT_PATH, FONT_SIZE)
-    except:
-        font = ImageFont.load_default()
+        renderer = AdmitCardRenderer(config, coordinates)
+    except Exception as e:
+        print(f"ERROR: Failed to set up renderer: {e}")
+        return False
     
     print(f"\nGenerating preview for first {PREVIEW_COUNT} student(s)...")
     
-    for i in range(min(PREVIEW_COUNT, len(data))):
-        row = data.iloc[i]
-        success, name, error = generate_single_card(row, Imagefilename, font)
+    preview_cards, failures = prepare_cards(read_csv(nrows=PREVIEW_COUNT), field_names, FIELD_FORMATS)
+    for failure in failures:
+        print(f"✗ Preview failed for {failure.name}: {failure.error}")
+    for card in preview_cards:
+        success, name, error, _ = renderer.save(card)
         
         if success:
-            safe_filename = sanitize_filename(row['roll no.'])
-            # Check for both JPG and PNG
-            jpg_path = os.path.join(Output_path, f"{safe_filename}.jpg")
-            png_path = os.path.join(Output_path, f"{safe_filename}.png")
-            
-            if os.path.exists(jpg_path):
-                img = Image.open(jpg_path)
-                preview_file = os.path.join(Output_path, f"PREVIEW_{safe_filename}.jpg")
-            elif os.path.exists(png_path):
-                img = Image.open(png_path)
-                preview_file = os.path.join(Output_path, f"PREVIEW_{safe_filename}.png")
-            else:
-                print(f"✗ Preview failed for {name}: Generated file not found")
-                continue
-            
+            # The renderer knows where it saved the card, whatever the layout
+            img = Image.open(renderer.output_file(card.filename))
+            preview_file = os.path.join(Output_path, f"PREVIEW_{card.filename}.{renderer.extension}")
             img.save(preview_file)
             print(f"✓ Preview generated: {preview_file}")
             print(f"  Student: {name}")
         else:
             print(f"✗ Preview failed for {name}: {error}")
     
+    if renderer.font_engine == 'atlas' and isinstance(renderer.font, ImageFont.FreeTypeFont):
+        # Pixel-diff the glyph atlas against ImageDraw.text on the preview rows
+        worst = renderer.compare_text_engines(preview_cards)
+        if worst == 0:
+            print("✓ Glyph atlas matches ImageDraw.text pixel for pixel")
+        else:
+            print(f"⚠ Glyph atlas differs from ImageDraw.text (max pixel difference: {worst})")
+    
     response = input("\nPreview looks good? Continue with full generation? (yes/no): ").strip().lower()
     return response in ['yes', 'y']
 
 
+def reissue_card(key):
+    """Regenerate one student's card, found by roll or registration number.
+
+    The row is read through the roster's sidecar index (<csv>.idx), built on
+    first use and rebuilt when the CSV changes, so the CSV is not parsed.
+    """
+    if not validate_template() or not validate_coordinates():
+        return False
+    
+    index = RosterIndex(DataFileName)
+    chunk = index.lookup(key)
+    if index.rebuilt:
+        print(f"✓ Indexed {index.rows} rows: {index.index_path}")
+    if chunk is None:
+        print(f"✗ No student with roll or registration number {key}")
+        return False
+    
+    cards, failures = prepare_cards(chunk, field_names, FIELD_FORMATS)
+    if failures:
+        print(f"✗ Cannot generate card for {failures[0].name}: {failures[0].error}")
+        return False
+    
+    try:
+        renderer = AdmitCardRenderer(config, coordinates)
+    except Exception as e:
+        print(f"ERROR: Failed to set up renderer: {e}")
+        return False
+    if not os.path.exists(Output_path):
+        os.makedirs(Output_path)
+    card = cards[0]
+    success, name, error, _ = renderer.save(card)
+    if not success:
+        print(f"✗ Card failed for {name}: {error}")
+        return False
+    print(f"✓ Card generated: {renderer.output_file(card.filename)}")
+    print(f"  Student: {name} (row {card.row + 1})")
+    return True
+
+
 def dry_run_validation():
     """Validate all data without generating files."""
     print("\n" + "="*50)
@@ -357,32 +405,41 @@ def dry_run_validation():
     if not validate_template() or not validate_coordinates():
         return
     
-    try:
-        font = ImageFont.truetype(FONT_PATH, FONT_SIZE)
-    except:
-        font = ImageFont.load_default()
+    print(f"\nValidating student records from {DataFileName}...\n")
     
-    print(f"\nValidating {len(data)} student records...\n")
+    validator = RosterValidator(field_names, SEMESTER_RANGE, DOB_FORMAT, APAAR_LENGTH)
+    for chunk in stream_chunks():
+        validator.add(chunk)
+    report = validator.report()
     
-    issues = []
-    for index, row in data.iterrows():
-        success, name, message = generate_single_card(row, Imagefilename, font, dry_run=True)
-        if not success:
-            issues.append((name, message))
-        elif message:
-            print(f"✓ {name}: {message}")
-    
-    if issues:
-        print(f"\n⚠ Found {len(issues)} issues:")
-        for name, error in issues:
-            print(f"  ✗ {name}: {error}")
+    # Machine-readable report: 0-based data row numbers per rule
+    if not os.path.exists(Output_path):
+        os.makedirs(Output_path)
+    report_path = os.path.join(Output_path, VALIDATION_REPORT)
+    with open(report_path, 'w') as f:
+        json.dump(report, f, indent=4)
+    
+    total = report['rows']
+    if report['invalid_rows']:
+        print(f"⚠ Found issues in {report['invalid_rows']} of {total} records:")
+        for rule, rows in report['issues'].items():
+            if rows:
+                shown = ', '.join(str(row + 1) for row in rows[:10])
+                more = f" ... and {len(rows) - 10} more" if len(rows) > 10 else ""
+                print(f"  ✗ {RosterValidator.RULES[rule]}: {len(rows)} rows ({shown}{more})")
+        print(f"\n✓ Report saved to: {report_path}")
         print("\nFix these issues before generating cards.")
     else:
-        print(f"\n✓ All {len(data)} records validated successfully!")
+        print(f"✓ All {total} records validated successfully!")
+        print(f"✓ Report saved to: {report_path}")
         print("Ready to generate admit cards.")
 
-def generate_admit_cards():
-    """Generate admit cards with multithreading and preview."""
+def generate_admit_cards(resume=False):
+    """Generate admit cards with multithreading and preview.
+
+    With resume=True the preview is skipped and cards recorded in the checkpoint
+    journal of an interrupted run are not rendered again.
+    """
     if not validate_template() or not validate_coordinates():
         return
     
@@ -391,56 +448,187 @@ def generate_admit_cards():
         print(f"✓ Created output directory: {Output_path}")
     
     # Preview mode
-    if PREVIEW_ENABLED:
+    if PREVIEW_ENABLED and not resume:
         if not preview_admit_card():
             print("\nGeneration cancelled by user")
             return
     
+    if ARCHIVE_ENABLED:
+        if resume:
+            print("⚠ Archives are rewritten on every run - generating every card")
+        generate_archive()
+        return
+    
+    from tqdm import tqdm
+    
     # Load font and template
     try:
-        font = ImageFont.truetype(FONT_PATH, FONT_SIZE)
+        renderer = AdmitCardRenderer(config, coordinates)
+    except Exception as e:
+        print(f"ERROR: Failed to set up renderer: {e}")
+        return
+    if renderer.font_loaded:
         print(f"✓ Loaded font: {FONT_PATH}")
-    except:
+    else:
         print("⚠ Font not found, using default")
-        font = ImageFont.load_default()
+    print(f"✓ Template loaded: {renderer.template.size[0]}x{renderer.template.size[1]}px")
     
-    try:
-        template_img = Image.open(Imagefilename)
-        print(f"✓ Template loaded: {template_img.size[0]}x{template_img.size[1]}px")
-    except Exception as e:
-        print(f"ERROR: Failed to load template: {e}")
-        return
+    use_processes = ENABLE_MULTITHREADING and RENDER_BACKEND == 'process'
     
-    print(f"\nGenerating {len(data)} admit cards...")
-    if ENABLE_MULTITHREADING:
+    print(f"\nGenerating admit cards from {DataFileName}...")
+    if use_processes:
+        print(f"✓ Multi-processing enabled ({MAX_WORKERS} workers, {CHUNK_SIZE} cards per task)")
+    elif ENABLE_MULTITHREADING:
         print(f"✓ Multi-threading enabled ({MAX_WORKERS} workers)")
     
+    render_id = render_fingerprint(config, coordinates)
+    existing_files = list_output_files(Output_path, OUTPUT_LAYOUT)
+    # Temp files of card writes cut short by a crash
+    for name in card_temp_files(existing_files, renderer.extension, OUTPUT_LAYOUT):
+        os.remove(os.path.join(Output_path, name))
+    
+    # The manifest indexes every card written; in incremental mode cards whose
+    # content hash matches the last run are also kept as they are
+    manifest = OutputManifest(os.path.join(Output_path, MANIFEST_FILE), render_id)
+    if INCREMENTAL:
+        manifest.load()
+        if manifest.reset:
+            print("⚠ Template, font, coordinates or settings changed - regenerating every card")
+    
+    # Checkpoint journal: every finished card is appended as soon as its file is in place
+    journal = CheckpointJournal(os.path.join(Output_path, CHECKPOINT_FILE), render_id)
+    finished = {}
+    if resume:
+        finished = journal.load()
+        if finished is None:
+            print("⚠ No checkpoint for these settings - generating every card")
+            finished = {}
+        else:
+            print(f"✓ Resuming: {len(finished)} cards already done")
+    journal.open(resume)
+    
+    extension = output_extension(config)
+    roll_index = field_names.index('roll no.')
+    seen = set()
+    digests = {}  # card row -> (roll number, digest) for cards being rendered
+    
     start_time = time.time()
     failed_cards = []
+    worker_cache_stats = {}
+    total = 0
+    unchanged = 0
+    resumed = 0
     
-    if ENABLE_MULTITHREADING:
-        # Multi-threaded generation (pass path, not image object)
-        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-            futures = {executor.submit(generate_single_card, row, Imagefilename, font, False): row 
-                      for _, row in data.iterrows()}
-            
-            for future in tqdm(as_completed(futures), total=len(data), desc="Progress", unit="card"):
-                success, name, error = future.result()
-                if not success:
-                    failed_cards.append((name, error))
-    else:
-        # Single-threaded generation
-        for _, row in tqdm(data.iterrows(), total=len(data), desc="Progress", unit="card"):
-            success, name, error = generate_single_card(row, Imagefilename, font, False)
-            if not success:
-                failed_cards.append((name, error))
+    # Image-mode PDF is assembled while rendering, one page at a time in roster order
+    pdf_writer = None
+    page_sink = None
+    if GENERATE_PDF and PDF_MODE == 'images':
+        pdf_writer = PDFWriter(os.path.join(Output_path, PDF_FILENAME))
+        page_sink = OrderedPageSink(pdf_writer)
+    
+    def index_card(key, digest, card, size):
+        manifest.update(key, digest, card.filename, card_path(card.filename, extension, OUTPUT_LAYOUT), size)
+    
+    def record(card, result):
+        nonlocal total
+        total += 1
+        success, name, error, size = result
+        if not success:
+            failed_cards.append((name, error))
+        if card.row in digests:
+            key, digest = digests.pop(card.row)
+            if success:
+                journal.record(key, digest, card.filename, size, renderer.output_file(card.filename))
+                index_card(key, digest, card, size)
+        if page_sink is not None:
+            page_sink.add(card.row, renderer.output_file(card.filename) if success else None)
+    
+    def iter_cards():
+        # Rows that cannot be drawn or have not changed are recorded as they are read,
+        # the rest go to the renderer
+        nonlocal unchanged, resumed
+        for cards, failures in iter_prepared():
+            for failure in failures:
+                record(failure, (False, failure.name, failure.error, None))
+            for card in cards:
+                key = card.texts[roll_index]
+                digest = card_digest(card.texts, card.filename)
+                seen.add(key)
+                done = finished.get(key)
+                if done is not None and done[:2] == (digest, card.filename) and done[2] is not None:
+                    # Files are renamed into place before they are journalled with their size, so the disk
+                    # is only checked when the PDF reads the card back (a missing card is rendered again)
+                    if page_sink is None or os.path.exists(renderer.output_file(card.filename)):
+                        resumed += 1
+                        index_card(key, digest, card, done[2])
+                        record(card, (True, card.name, None, done[2]))
+                        continue
+                if manifest.is_current(key, digest, existing_files, extension):
+                    unchanged += 1
+                    record(card, (True, card.name, None, None))
+                    continue
+                digests[card.row] = (key, digest)
+                yield card
+    
+    try:
+        if use_processes:
+            # Multi-process generation: each worker is initialised once, cards go out in chunks
+            with ProcessPoolExecutor(max_workers=MAX_WORKERS, initializer=init_process_worker,
+                                     initargs=(config, coordinates)) as executor:
+                completed = run_windowed(lambda chunk: executor.submit(render_chunk, chunk),
+                                         batched(iter_cards(), CHUNK_SIZE), MAX_IN_FLIGHT)
+                with tqdm(desc="Progress", unit="card") as progress:
+                    for chunk, future in completed:
+                        results, pid, cache_stats = future.result()
+                        worker_cache_stats[pid] = cache_stats
+                        for card, result in zip(chunk, results):
+                            record(card, result)
+                        progress.update(len(results))
+        elif ENABLE_MULTITHREADING:
+            # Multi-threaded generation (threads share the renderer and its decoded template)
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                completed = run_windowed(lambda card: executor.submit(renderer.save, card),
+                                         iter_cards(), MAX_IN_FLIGHT)
+                for card, future in tqdm(completed, desc="Progress", unit="card"):
+                    record(card, future.result())
+        else:
+            # Single-threaded generation
+            for card in tqdm(iter_cards(), desc="Progress", unit="card"):
+                record(card, renderer.save(card))
+    except BaseException:
+        # Cards written so far stay in the journal for --resume; a PDF cut short is not kept
+        if pdf_writer is not None:
+            pdf_writer.abort()
+        journal.close()
+        print("\n✗ Generation stopped - run with --resume to continue")
+        raise
+    
+    if pdf_writer is not None:
+        pdf_writer.close()
+    manifest.save()
+    # The run is complete, nothing left to resume
+    journal.remove()
     
     elapsed_time = time.time() - start_time
     
     # Summary
-    print(f"\n✓ Successfully generated {len(data) - len(failed_cards)}/{len(data)} admit cards")
-    print(f"✓ Time taken: {elapsed_time:.2f} seconds ({len(data)/elapsed_time:.2f} cards/sec)")
+    print(f"\n✓ Successfully generated {total - len(failed_cards)}/{total} admit cards")
+    print(f"✓ Time taken: {elapsed_time:.2f} seconds ({total/elapsed_time:.2f} cards/sec)")
     print(f"✓ Saved to: {Output_path}")
+    if resumed:
+        print(f"✓ Resumed from checkpoint: {resumed} cards already done")
+    if unchanged:
+        print(f"✓ Unchanged since last run: {unchanged} cards (not re-rendered)")
+    
+    if renderer.text_cache is not None:
+        if use_processes:
+            hits = sum(h for h, _ in worker_cache_stats.values())
+            misses = sum(m for _, m in worker_cache_stats.values())
+        else:
+            hits, misses = renderer.cache_stats()
+        lookups = hits + misses
+        hit_rate = hits / lookups * 100 if lookups else 0
+        print(f"✓ Text cache: {hits} hits, {misses} misses ({hit_rate:.1f}% hit rate)")
     
     if failed_cards:
         print(f"\n⚠ Failed to generate {len(failed_cards)} cards:")
@@ -449,15 +637,195 @@ def generate_admit_cards():
         if len(failed_cards) > 5:
             print(f"  ... and {len(failed_cards) - 5} more")
     
-    # Generate PDF if enabled
-    if GENERATE_PDF:
+    stale = manifest.stale(seen, extension)
+    if stale:
+        print(f"\n⚠ {len(stale)} stale cards from students no longer in the roster (not deleted):")
+        for roll_no, path in stale[:5]:
+            print(f"  - {roll_no}: {path}")
+        if len(stale) > 5:
+            print(f"  ... and {len(stale) - 5} more")
+    
+    if pdf_writer is not None:
+        print(f"\n✓ PDF generated: {pdf_writer.path} ({page_sink.pages} pages)")
+        print(f"✓ File size: {os.path.getsize(pdf_writer.path) / (1024*1024):.2f} MB")
+    elif GENERATE_PDF:
         generate_pdf_output()
 
 
+def generate_archive():
+    """Render every card to memory and stream it into stored ZIP volumes.
+
+    Nothing is written per card: each volume is one sequential file, split
+    by size or by course when configured.
+    """
+    from tqdm import tqdm
+    
+    if ARCHIVE_SPLIT == 'course' and 'course' not in field_names:
+        print("ERROR: Splitting archives by course needs a 'course' field")
+        return
+    try:
+        renderer = AdmitCardRenderer(config, coordinates)
+    except Exception as e:
+        print(f"ERROR: Failed to set up renderer: {e}")
+        return
+    if not renderer.font_loaded:
+        print("⚠ Font not found, using default")
+    
+    use_processes = ENABLE_MULTITHREADING and RENDER_BACKEND == 'process'
+    split_by = {'size': 'size', 'course': 'group'}.get(ARCHIVE_SPLIT)
+    sink = ZipVolumeSink(Output_path, ARCHIVE_FILENAME, split_by, ARCHIVE_VOLUME_MB * 1024 * 1024)
+    course_index = field_names.index('course') if 'course' in field_names else None
+    print(f"\nWriting admit cards from {DataFileName} into {ARCHIVE_FILENAME}"
+          f"{' volumes by ' + ARCHIVE_SPLIT if split_by else ''}...")
+    
+    start_time = time.time()
+    failed_cards = []
+    total = 0
+    
+    def record(card, result):
+        nonlocal total
+        total += 1
+        success, name, error, data = result
+        if not success:
+            failed_cards.append((name, error))
+            return
+        group = sanitize_filename(card.texts[course_index]).replace(' ', '_') if split_by == 'group' else None
+        if not sink.add(f"{card.filename}.{renderer.extension}", data, group):
+            failed_cards.append((name, "Duplicate filename in archive"))
+    
+    def iter_cards():
+        for cards, failures in iter_prepared():
+            for failure in failures:
+                record(failure, (False, failure.name, failure.error, None))
+            yield from cards
+    
+    try:
+        if use_processes:
+            with ProcessPoolExecutor(max_workers=MAX_WORKERS, initializer=init_process_worker,
+                                     initargs=(config, coordinates)) as executor:
+                completed = run_windowed(lambda chunk: executor.submit(encode_chunk, chunk),
+                                         batched(iter_cards(), CHUNK_SIZE), MAX_IN_FLIGHT)
+                with tqdm(desc="Progress", unit="card") as progress:
+                    for chunk, future in completed:
+                        results, _, _ = future.result()
+                        for card, result in zip(chunk, results):
+                            record(card, result)
+                        progress.update(len(results))
+        elif ENABLE_MULTITHREADING:
+            with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+                completed = run_windowed(lambda card: executor.submit(renderer.encode, card),
+                                         iter_cards(), MAX_IN_FLIGHT)
+                for card, future in tqdm(completed, desc="Progress", unit="card"):
+                    record(card, future.result())
+        else:
+            for card in tqdm(iter_cards(), desc="Progress", unit="card"):
+                record(card, renderer.encode(card))
+    except BaseException:
+        sink.abort()
+        raise
+    volumes = sink.close()
+    
+    elapsed_time = time.time() - start_time
+    print(f"\n✓ Successfully generated {total - len(failed_cards)}/{total} admit cards")
+    print(f"✓ Time taken: {elapsed_time:.2f} seconds ({total/elapsed_time:.2f} cards/sec)")
+    for path, entries, size in volumes:
+        print(f"✓ {path}: {entries} cards, {size / (1024*1024):.2f} MB")
+    if failed_cards:
+        print(f"\n⚠ Failed to generate {len(failed_cards)} cards:")
+        for name, error in failed_cards[:5]:
+            print(f"  - {name}: {error}")
+        if len(failed_cards) > 5:
+            print(f"  ... and {len(failed_cards) - 5} more")
+    
+    if GENERATE_PDF:
+        if PDF_MODE == 'vector':
+            generate_vector_pdf()
+        else:
+            print("⚠ Image-mode PDF needs card files - set pdf_mode to \"vector\" with archive output")
+
+
+def generate_vector_pdf():
+    """Write the PDF straight from the CSV, without rendering card images.
+
+    The template is embedded once as an image XObject shared by every page,
+    and the fields are real text in the configured font, embedded once.
+    """
+    if not validate_template() or not validate_coordinates():
+        return
+    
+    from tqdm import tqdm
+    
+    try:
+        font = ImageFont.truetype(FONT_PATH, FONT_SIZE)
+    except Exception as e:
+        print(f"ERROR: Vector PDF needs the TrueType font {FONT_PATH}: {e}")
+        return
+    
+    template = load_template(Imagefilename, OPTIMIZE_IMAGES or COLOR_MODE != 'rgb', COLOR_MODE, PALETTE_COLORS, BILEVEL_THRESHOLD)
+    try:
+        plan = compile_render_plan(config, coordinates, template, font)
+    except ValueError as e:
+        print(f"ERROR: {e}")
+        return
+    width, height = template.size
+    page_width, page_height = width * PX_TO_PT, height * PX_TO_PT
+    ascent = font.getmetrics()[0]
+    red, green, blue = (c / 255 for c in ImageColor.getrgb(FONT_COLOR)[:3])
+    
+    # Text origins in PDF space (baseline, y up) are the same on every page
+    origins = [(entry.index, entry.origin[0] * PX_TO_PT, (height - entry.origin[1] - ascent) * PX_TO_PT)
+               for entry in plan.fields]
+    page_start = (f'q {page_width:.2f} 0 0 {page_height:.2f} 0 0 cm /Tpl Do Q '
+                  f'BT /F1 {FONT_SIZE * PX_TO_PT:.2f} Tf {red:.3f} {green:.3f} {blue:.3f} rg\n').encode('latin-1')
+    
+    if not os.path.exists(Output_path):
+        os.makedirs(Output_path)
+    pdf_path = os.path.join(Output_path, PDF_FILENAME)
+    print(f"\nWriting vector PDF from {DataFileName}...")
+    
+    skipped = []
+    try:
+        with PDFWriter(pdf_path) as writer:
+            if COLOR_MODE != 'rgb':
+                # Indexed or 1-bit template, a fraction of the size of a JPEG one
+                template_id = writer.add_image(template)
+            elif OPTIMIZE_IMAGES:
+                buffer = io.BytesIO()
+                template.save(buffer, 'JPEG', quality=IMAGE_QUALITY, optimize=True)
+                template_id = writer.add_jpeg(buffer.getvalue(), width, height)
+            else:
+                template_id = writer.add_image(template)
+            pdf_font = EmbeddedTrueTypeFont(writer, FONT_PATH)
+            
+            progress = tqdm(desc="Progress", unit="page")
+            for cards, failures in iter_prepared():
+                skipped.extend((failure.name, failure.error) for failure in failures)
+                for card in cards:
+                    content = [page_start]
+                    for index, x, y in origins:
+                        content.append(f'1 0 0 1 {x:.2f} {y:.2f} Tm '.encode('latin-1') + pdf_font.show(card.texts[index]) + b' Tj\n')
+                    content.append(b'ET')
+                    writer.add_page(page_width, page_height, b''.join(content),
+                                    xobjects={'Tpl': template_id}, fonts={'F1': pdf_font.obj_id})
+                progress.update(len(cards) + len(failures))
+            progress.close()
+            
+            pdf_font.finish()
+        
+        print(f"✓ PDF generated: {pdf_path}")
+        print(f"✓ File size: {os.path.getsize(pdf_path) / (1024*1024):.2f} MB")
+        if skipped:
+            print(f"\n⚠ Skipped {len(skipped)} students:")
+            for name, error in skipped[:5]:
+                print(f"  - {name}: {error}")
+    except Exception as e:
+        print(f"ERROR generating PDF: {e}")
+
+
 def generate_pdf_output():
-    """Generate combined PDF from all admit cards."""
-    if not PDF_SUPPORT:
-        print("\n⚠ PDF generation requires img2pdf. Install: pip install img2pdf")
+    """Generate combined PDF from all admit cards, one page at a time."""
+    if PDF_MODE == 'vector':
+        generate_vector_pdf()
         return
     
     print("\n" + "="*50)
@@ -465,32 +833,55 @@ def generate_pdf_output():
     print("="*50)
     
     try:
-        # Collect all image files (PNG or JPG)
-        image_files = []
-        for _, row in data.iterrows():
-            safe_filename = sanitize_filename(row['roll no.'])
-            # Check for both JPG and PNG
-            jpg_path = os.path.join(Output_path, f"{safe_filename}.jpg")
-            png_path = os.path.join(Output_path, f"{safe_filename}.png")
-            
-            if os.path.exists(jpg_path):
-                image_files.append(jpg_path)
-            elif os.path.exists(png_path):
-                image_files.append(png_path)
+        pdf_path = os.path.join(Output_path, PDF_FILENAME)
+        print("\nCombining cards into PDF...")
         
-        if not image_files:
-            print("ERROR: No admit card images found")
-            return
+        # Cards are found through the manifest of the last run, not by probing the disk
+        manifest = OutputManifest(os.path.join(Output_path, MANIFEST_FILE), None)
+        manifest.load()
+        cards = manifest.previous
+        existing_files = None
+        if not cards:
+            print("⚠ No manifest in the output folder - looking for card files")
         
-        # Generate PDF
-        pdf_path = os.path.join(Output_path, PDF_FILENAME)
-        print(f"\nCombining {len(image_files)} cards into PDF...")
+        # Stream pages straight into the file (PNG or JPG), in roster order
+        missing = []
+        with PDFWriter(pdf_path) as writer:
+            for chunk in stream_chunks():
+                rolls = chunk['roll no.'].astype(str)
+                for roll_no, safe_filename in zip(rolls, sanitize_filenames(chunk['roll no.'])):
+                    entry = cards.get(roll_no)
+                    if entry is not None and entry.path is not None:
+                        card_file = os.path.join(Output_path, entry.path)
+                        # A card deleted or moved since the run is skipped, not fatal
+                        if os.path.exists(card_file):
+                            writer.add_image_page(card_file)
+                        else:
+                            missing.append(roll_no)
+                        continue
+                    # Folders written before the manifest held paths: list the folder once
+                    if existing_files is None:
+                        existing_files = set(os.listdir(Output_path))
+                    for extension in ('jpg', 'png', 'tif'):
+                        if f"{safe_filename}.{extension}" in existing_files:
+                            writer.add_image_page(os.path.join(Output_path, f"{safe_filename}.{extension}"))
+                            break
+                    else:
+                        missing.append(roll_no)
         
-        with open(pdf_path, "wb") as f:
-            f.write(img2pdf.convert(image_files))
+        if not writer.page_ids:
+            os.remove(pdf_path)
+            print("ERROR: No admit card images found")
+            return
         
-        print(f"✓ PDF generated: {pdf_path}")
+        print(f"✓ PDF generated: {pdf_path} ({len(writer.page_ids)} pages)")
         print(f"✓ File size: {os.path.getsize(pdf_path) / (1024*1024):.2f} MB")
+        if missing:
+            print(f"⚠ Skipped {len(missing)} students without a card file:")
+            for roll_no in missing[:5]:
+                print(f"  - {roll_no}")
+            if len(missing) > 5:
+                print(f"  ... and {len(missing) - 5} more")
         
     except Exception as e:
         print(f"ERROR generating PDF: {e}")
@@ -506,30 +897,48 @@ if __name__ == "__main__":
     print('  "Preview"  - Generate preview card(s) only')
     print('  "Generate" - Create admit cards for all students')
     print('  "PDF"      - Generate PDF from existing cards\n')
+    print('Run with --resume to continue an interrupted Generate run.')
+    print('Run with --card <roll or reg no.> to regenerate one student\'s card.\n')
     
-    user_input = input("Enter your choice: ").strip().title()
+    if '--card' in sys.argv[1:-1]:
+        user_input = "Card"
+    elif '--resume' in sys.argv[1:]:
+        user_input = "Resume"
+    else:
+        user_input = input("Enter your choice: ").strip().title()
     
     if user_input == "Load":
         if not validate_template():
             exit(1)
         find_coordinates()
     elif user_input == "Validate":
-        if data is not None:
+        if load_and_validate_data():
             dry_run_validation()
         else:
             print("Cannot validate - data loading failed")
     elif user_input == "Preview":
-        if data is not None:
+        if load_and_validate_data():
             preview_admit_card()
         else:
             print("Cannot generate preview - data loading failed")
     elif user_input == "Generate":
-        if data is not None:
+        if load_and_validate_data():
             generate_admit_cards()
         else:
             print("Cannot generate cards - data loading failed")
+    elif user_input == "Resume":
+        if load_and_validate_data():
+            generate_admit_cards(resume=True)
+        else:
+            print("Cannot resume - data loading failed")
+    elif user_input == "Card":
+        if load_and_validate_data():
+            if not reissue_card(sys.argv[sys.argv.index('--card') + 1]):
+                exit(1)
+        else:
+            print("Cannot generate card - data loading failed")
     elif user_input == "Pdf":
-        if data is not None:
+        if load_and_validate_data():
             generate_pdf_output()
         else:
             print("Cannot generate PDF - data loading failed")
@@ -7,17 +7,21 @@ import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 import threading
 import json
+import io
 import os
-import re
 from PIL import Image, ImageDraw, ImageFont
 import pandas as pd
 import time
+from pdf_writer import PDFWriter
+from roster import prepare_cards, RosterValidator, RosterIndex
+from manifest import CheckpointJournal, render_fingerprint, card_digest, replace_atomic
+from renderer import compile_render_plan
 
 class AdmitCardGeneratorGUI:
     def __init__(self, root):
         self.root = root
         self.root.title("Admit Card Generator v2.0")
-        self.root.geometry("700x650")
+        self.root.geometry("700x690")
         self.root.resizable(False, False)
         
         # Load config
@@ -65,6 +69,11 @@ class AdmitCardGeneratorGUI:
         ttk.Entry(file_frame, textvariable=self.output_var, width=45).grid(row=2, column=1, padx=5)
         ttk.Button(file_frame, text="Browse", command=self.browse_output).grid(row=2, column=2)
         
+        # Student to preview (blank = first row)
+        ttk.Label(file_frame, text="Preview Roll/Reg No.:").grid(row=3, column=0, sticky="w", pady=5)
+        self.preview_key_var = tk.StringVar()
+        ttk.Entry(file_frame, textvariable=self.preview_key_var, width=45).grid(row=3, column=1, padx=5)
+        
         # Options frame
         options_frame = ttk.LabelFrame(self.root, text="Options", padding=10)
         options_frame.pack(fill="x", padx=20, pady=10)
@@ -113,6 +122,8 @@ class AdmitCardGeneratorGUI:
                   command=self.preview_card, width=18).grid(row=1, column=0, padx=5, pady=5)
         ttk.Button(button_frame, text="Generate Cards", 
                   command=self.generate_cards, width=18).grid(row=1, column=1, padx=5, pady=5)
+        ttk.Button(button_frame, text="Resume Generation", 
+                  command=self.resume_cards, width=18).grid(row=2, column=0, columnspan=2, padx=5, pady=5)
         
         # Progress frame
         progress_frame = ttk.LabelFrame(self.root, text="Progress", padding=10)
@@ -168,31 +179,19 @@ class AdmitCardGeneratorGUI:
         thread.daemon = True
         thread.start()
     
-    def sanitize_filename(self, filename):
-        """Sanitize filename for security"""
-        filename = str(filename)
-        filename = os.path.basename(filename)
-        filename = re.sub(r'[^a-zA-Z0-9\s\-_.]', '_', filename)
-        filename = filename.strip('. ')
-        if len(filename) > 200:
-            filename = filename[:200]
-        if not filename:
-            filename = 'unnamed'
-        return filename
+    def resume_cards(self):
+        """Continue an interrupted generation from its checkpoint journal"""
+        thread = threading.Thread(target=self._generate_cards_thread, args=(True,))
+        thread.daemon = True
+        thread.start()
     
-    def to_roman(self, num):
-        """Convert number to Roman numeral"""
-        val = [10, 9, 5, 4, 1]
-        syms = ['X', 'IX', 'V', 'IV', 'I']
-        roman = ''
-        i = 0
-        num = int(num)
-        while num > 0:
-            for _ in range(num // val[i]):
-                roman += syms[i]
-                num -= val[i]
-            i += 1
-        return roman
+    def render_card(self, template, plan, texts):
+        """Draw one card's pre-formatted texts on a copy of the template."""
+        img = template.copy()
+        draw = ImageDraw.Draw(img)
+        for entry in plan.fields:
+            draw.text(entry.origin, texts[entry.index], font=entry.font, fill=entry.fill)
+        return img
     
     def _validate_thread(self):
         """Validate data in background"""
@@ -201,8 +200,8 @@ class AdmitCardGeneratorGUI:
             self.progress_bar['value'] = 0
             
             # Load data
-            data = pd.read_csv(self.csv_var.get())
             field_names = self.config['fields']
+            data = pd.read_csv(self.csv_var.get(), dtype={field: str for field in field_names})
             
             # Check columns
             missing_cols = [col for col in field_names if col not in data.columns]
@@ -211,12 +210,14 @@ class AdmitCardGeneratorGUI:
                 self.progress_var.set("Validation failed")
                 return
             
-            # Check for missing data
-            issues = []
-            for idx, row in data.iterrows():
-                for field in field_names:
-                    if pd.isna(row[field]):
-                        issues.append(f"Row {idx+1}: Missing {field}")
+            # Check every rule over whole columns
+            rules = self.config.get('validation', {})
+            validator = RosterValidator(field_names, rules.get('semester_range', [1, 10]),
+                                        rules.get('dob_format', '%d/%m/%Y'), rules.get('apaar_length', 12))
+            validator.add(data)
+            report = validator.report()
+            issues = [f"Row {row+1}: {RosterValidator.RULES[rule]}"
+                      for rule, rows in report['issues'].items() for row in rows]
             
             if issues:
                 msg = f"Found {len(issues)} issues:\n" + "\n".join(issues[:10])
@@ -238,38 +239,45 @@ class AdmitCardGeneratorGUI:
             self.progress_var.set("Generating preview...")
             self.progress_bar['value'] = 50
             
-            # Load data
-            data = pd.read_csv(self.csv_var.get())
+            # Load one row as strings: the requested student through the roster index, else the first row
+            field_names = self.config['fields']
+            key = self.preview_key_var.get().strip()
+            if key:
+                data = RosterIndex(self.csv_var.get()).lookup(key)
+                if data is None:
+                    messagebox.showerror("Error", f"No student with roll or registration number {key}")
+                    return
+            else:
+                data = pd.read_csv(self.csv_var.get(), dtype={field: str for field in field_names}, nrows=1)
             if len(data) == 0:
                 messagebox.showerror("Error", "No data in CSV")
                 return
             
-            row = data.iloc[0]
+            # Pre-format the texts and filename exactly as a full run does
+            cards, failures = prepare_cards(data, field_names, self.config.get('formats', {'semester': 'roman'}))
+            if failures:
+                messagebox.showerror("Error", f"Cannot preview {failures[0].name}: {failures[0].error}")
+                return
+            card = cards[0]
             
             # Load template and font
             template = Image.open(self.template_var.get())
             font = ImageFont.truetype(self.config['font']['path'], self.config['font']['size'])
             
-            # Load coordinates
+            # Load coordinates and compile them into the render plan
             with open(self.config['paths']['coordinates'], 'r') as f:
                 coords = json.load(f)
+            plan = compile_render_plan(self.config, coords, template, font)
             
             # Generate preview
-            img = template.copy()
-            draw = ImageDraw.Draw(img)
-            
-            for field, coord in coords.items():
-                if field in row:
-                    x, y = coord
-                    value = self.to_roman(row[field]) if field == 'semester' else str(row[field])
-                    draw.text((x, y), value, font=font, fill=self.config['font']['color'])
+            img = self.render_card(template, plan, card.texts)
             
             # Save preview
             output_path = self.output_var.get()
             os.makedirs(output_path, exist_ok=True)
             
-            safe_filename = self.sanitize_filename(row['roll no.'])
-            preview_file = os.path.join(output_path, f"PREVIEW_{safe_filename}.jpg")
+            extension = 'jpg' if self.optimize_var.get() else 'png'
+            preview_file = os.path.join(output_path, f"PREVIEW_{card.filename}.{extension}")
             
             # Apply optimization
             if self.optimize_var.get():
@@ -291,15 +299,19 @@ class AdmitCardGeneratorGUI:
             self.progress_var.set("Preview error")
             messagebox.showerror("Error", str(e))
     
-    def _generate_cards_thread(self):
-        """Background thread for card generation"""
+    def _generate_cards_thread(self, resume=False):
+        """Background thread for card generation (resume skips cards in the checkpoint journal)"""
         try:
             self.progress_var.set("Loading data...")
             self.progress_bar['value'] = 0
             
-            # Load data
-            data = pd.read_csv(self.csv_var.get())
+            # Load data and pre-format every card's texts and filename
+            field_names = self.config['fields']
+            data = pd.read_csv(self.csv_var.get(), dtype={field: str for field in field_names})
             total = len(data)
+            formats = self.config.get('formats', {'semester': 'roman'})
+            cards, failures = prepare_cards(data, field_names, formats)
+            del data
             
             self.progress_var.set(f"Generating {total} cards...")
             self.status_label.config(text=f"Multi-threading: {'Enabled' if self.multithread_var.get() else 'Disabled'} | Optimization: {'Enabled' if self.optimize_var.get() else 'Disabled'}")
@@ -308,61 +320,97 @@ class AdmitCardGeneratorGUI:
             template = Image.open(self.template_var.get())
             font = ImageFont.truetype(self.config['font']['path'], self.config['font']['size'])
             
-            # Load coordinates
+            # Load coordinates and compile them into the render plan
             with open(self.config['paths']['coordinates'], 'r') as f:
                 coords = json.load(f)
+            plan = compile_render_plan(self.config, coords, template, font)
             
             # Generate cards
             output_path = self.output_var.get()
             os.makedirs(output_path, exist_ok=True)
             
+            # Checkpoint journal: every saved card is appended, so an interrupted run can resume
+            # The GUI saves flat RGB cards through Pillow, with its own template and quality
+            gui_config = dict(self.config, paths=dict(self.config['paths'], template=self.template_var.get()),
+                              optimization={'enabled': self.optimize_var.get(), 'quality': self.quality_var.get(),
+                                            'encoder': 'pillow', 'color_mode': 'rgb'},
+                              output={'layout': 'flat'})
+            render_id = render_fingerprint(gui_config, coords)
+            journal = CheckpointJournal(os.path.join(output_path, self.config['output'].get('checkpoint_file', 'checkpoint.jsonl')), render_id)
+            finished = journal.load() if resume else None
+            if resume and finished is None:
+                messagebox.showinfo("Resume", "No checkpoint for these settings - generating every card")
+            finished = finished or {}
+            journal.open(resume)
+            roll_index = field_names.index('roll no.')
+            extension = 'jpg' if self.optimize_var.get() else 'png'
+            
             start_time = time.time()
-            failed = []
+            failed = [(failure.name, failure.error) for failure in failures]
             
-            for i, (_, row) in enumerate(data.iterrows()):
-                try:
-                    img = template.copy()
-                    draw = ImageDraw.Draw(img)
-                    
-                    for field, coord in coords.items():
-                        if field in row:
-                            x, y = coord
-                            value = self.to_roman(row[field]) if field == 'semester' else str(row[field])
-                            draw.text((x, y), value, font=font, fill=self.config['font']['color'])
-                    
-                    safe_filename = self.sanitize_filename(row['roll no.'])
-                    
-                    # Apply optimization
-                    if self.optimize_var.get():
-                        if img.mode in ('RGBA', 'LA', 'P'):
-                            rgb_img = Image.new('RGB', img.size, (255, 255, 255))
-                            if img.mode == 'P':
-                                img = img.convert('RGBA')
-                            rgb_img.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
-                            img = rgb_img
-                        filename = os.path.join(output_path, f"{safe_filename}.jpg")
-                        img.save(filename, 'JPEG', quality=self.quality_var.get(), optimize=True)
-                    else:
-                        filename = os.path.join(output_path, f"{safe_filename}.png")
-                        img.save(filename, 'PNG', optimize=True)
+            # PDF pages are appended as each card is saved, not in a second pass
+            pdf_writer = None
+            if self.pdf_var.get():
+                pdf_path = os.path.join(output_path, self.config['output'].get('pdf_filename', 'admit_cards.pdf'))
+                pdf_writer = PDFWriter(pdf_path)
+            
+            try:
+                for i, card in enumerate(cards, len(failures)):
+                    try:
+                        key = card.texts[roll_index]
+                        digest = card_digest(card.texts, card.filename)
+                        filename = os.path.join(output_path, f"{card.filename}.{extension}")
+                        
+                        if finished.get(key, ())[:2] != (digest, card.filename):
+                            img = self.render_card(template, plan, card.texts)
+                            
+                            # Apply optimization, encoding in memory for a temp file renamed into place
+                            buffer = io.BytesIO()
+                            if self.optimize_var.get():
+                                if img.mode in ('RGBA', 'LA', 'P'):
+                                    rgb_img = Image.new('RGB', img.size, (255, 255, 255))
+                                    if img.mode == 'P':
+                                        img = img.convert('RGBA')
+                                    rgb_img.paste(img, mask=img.split()[-1] if img.mode in ('RGBA', 'LA') else None)
+                                    img = rgb_img
+                                img.save(buffer, 'JPEG', quality=self.quality_var.get(), optimize=True)
+                            else:
+                                img.save(buffer, 'PNG', optimize=True)
+                            data = buffer.getvalue()
+                            def write(path):
+                                with open(path, 'wb') as f:
+                                    f.write(data)
+                            replace_atomic(filename, write, sync=False)
+                            journal.record(key, digest, card.filename, len(data), filename)
+                        
+                        if pdf_writer is not None:
+                            pdf_writer.add_image_page(filename)
+                        
+                    except Exception as e:
+                        failed.append((card.name, str(e)))
                     
-                except Exception as e:
-                    failed.append((row.get('name', 'Unknown'), str(e)))
-                
-                # Update progress
-                progress = (i + 1) / total * 100
-                self.progress_bar['value'] = progress
-                elapsed = time.time() - start_time
-                speed = (i + 1) / elapsed if elapsed > 0 else 0
-                self.progress_var.set(f"Generated {i+1}/{total} cards ({speed:.1f} cards/sec)")
-                self.root.update_idletasks()
+                    # Update progress
+                    progress = (i + 1) / total * 100
+                    self.progress_bar['value'] = progress
+                    elapsed = time.time() - start_time
+                    speed = (i + 1) / elapsed if elapsed > 0 else 0
+                    self.progress_var.set(f"Generated {i+1}/{total} cards ({speed:.1f} cards/sec)")
+                    self.root.update_idletasks()
+            except BaseException:
+                # Saved cards stay in the journal for Resume; a PDF cut short is not kept
+                if pdf_writer is not None:
+                    pdf_writer.abort()
+                journal.close()
+                raise
             
             elapsed_time = time.time() - start_time
+            # The run is complete, nothing left to resume
+            journal.remove()
             
-            # PDF generation if enabled
-            if self.pdf_var.get():
-                self.progress_var.set("Generating PDF...")
-                self._generate_pdf(output_path, data)
+            if pdf_writer is not None:
+                pdf_writer.close()
+                file_size = os.path.getsize(pdf_writer.path) / (1024*1024)
+                self.progress_var.set(f"✓ PDF generated ({file_size:.1f} MB)")
             
             # Summary
             success_count = total - len(failed)
@@ -378,34 +426,6 @@ class AdmitCardGeneratorGUI:
         except Exception as e:
             self.progress_var.set("Error occurred")
             messagebox.showerror("Error", str(e))
-    
-    def _generate_pdf(self, output_path, data):
-        """Generate combined PDF from images"""
-        try:
-            import img2pdf
-            
-            images = []
-            for _, row in data.iterrows():
-                safe_filename = self.sanitize_filename(row['roll no.'])
-                jpg_path = os.path.join(output_path, f"{safe_filename}.jpg")
-                png_path = os.path.join(output_path, f"{safe_filename}.png")
-                
-                if os.path.exists(jpg_path):
-                    images.append(jpg_path)
-                elif os.path.exists(png_path):
-                    images.append(png_path)
-            
-            if images:
-                pdf_path = os.path.join(output_path, self.config['output'].get('pdf_filename', 'admit_cards.pdf'))
-                with open(pdf_path, "wb") as f:
-                    f.write(img2pdf.convert(images))
-                
-                file_size = os.path.getsize(pdf_path) / (1024*1024)
-                self.progress_var.set(f"✓ PDF generated ({file_size:.1f} MB)")
-        except ImportError:
-            messagebox.showwarning("Warning", "img2pdf not installed. Run: pip install img2pdf")
-        except Exception as e:
-            messagebox.showwarning("Warning", f"PDF generation failed: {e}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,193 @@
+"""
+Job Daemon - Render jobs submitted by appending lines to a JSONL spool
+
+Upstream systems submit work by appending one JSON object per line to the
+spool file (jobs.jsonl by default) instead of driving generator6.py's menu:
+
+    {"id": "cse-2025", "roster": "uploads/students_20251129_104218.csv"}
+    {"roster": "ece.csv", "department": "ECE", "format": "png", "output": "output/ece"}
+    {"roster": "mba.csv", "layout": "mba/config.json"}
+    {"roster": "print.csv", "format": "tif"}
+
+"layout" is another config.json (template, font, coordinates, fields) and
+"format" is "jpg", "png", "png8" (palette PNG) or "tif" (1-bit CCITT G4,
+for print runs). Jobs run concurrently on warm render pools,
+one per layout and format (see render_service.RenderService). Every
+finished job appends a completion record with its counts and timing to
+the results file.
+
+The daemon is crash-safe: the offset file holds the spool position before
+which every job has completed, and jobs after it that already have a
+completion record are skipped on restart. A job that was running when the
+daemon died is rendered again into the same folder.
+
+    python job_daemon.py [spool.jsonl]
+
+TIME COMPLEXITY ANALYSIS:
+- Tailing: O(b) per poll - b = bytes appended since the last poll
+- Restart: O(r) - r = completion records after the saved offset
+
+SPACE COMPLEXITY ANALYSIS:
+- O(j) - offsets of the jobs not yet completed
+"""
+
+import json
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+from manifest import replace_atomic
+from render_service import RenderService, load_service_config, CONFIG_FILE
+from renderer import output_extension
+
+# Output format -> optimization settings it overrides
+FORMATS = {'jpg': {'enabled': True, 'color_mode': 'rgb'}, 'png': {'enabled': False, 'color_mode': 'rgb'},
+           'png8': {'color_mode': 'palette'}, 'tif': {'color_mode': 'bilevel'}}
+
+
+class JobDaemon:
+    """Tail a JSONL spool and feed its jobs to render services."""
+
+    def __init__(self, config_path=CONFIG_FILE, spool_path=None):
+        self.config_path = config_path
+        config, _ = load_service_config(config_path)
+        service = config.get('service', {})
+        self.spool_path = spool_path or service.get('spool_file', 'jobs.jsonl')
+        self.results_path = service.get('results_file', 'jobs.results.jsonl')
+        self.offset_path = self.spool_path + '.offset'
+        self.poll_interval = service.get('spool_poll_seconds', 0.5)
+        color_mode = config.get('optimization', {}).get('color_mode', 'rgb')
+        self.default_format = {'palette': 'png8', 'bilevel': 'tif'}.get(color_mode) or output_extension(config)
+
+        self.services = {}     # (layout, format) -> started RenderService
+        self.pending = set()   # Spool offsets of submitted, unfinished jobs
+        self.job_offsets = {}  # Job id -> spool offset, for the jobs in pending
+        self.position = 0      # Spool offset of the next unread line
+        self._lock = threading.Lock()
+
+    def service_for(self, layout, output_format):
+        """Started RenderService for a layout config and output format (created on first use)."""
+        key = (os.path.abspath(layout), output_format)
+        if key not in self.services:
+            config, coordinates = load_service_config(layout)
+            config.setdefault('optimization', {}).update(FORMATS[output_format])
+            service = RenderService(config, coordinates)
+            service.on_finish = self.finished
+            service.start()
+            print(f"✓ Render pool started for {layout} ({output_format})")
+            self.services[key] = service
+        return self.services[key]
+
+    def recover(self):
+        """Return the offsets completed after the saved offset, and move to the saved offset."""
+        try:
+            with open(self.offset_path, 'r') as f:
+                self.position = json.load(f)['offset']
+        except (OSError, ValueError, KeyError):
+            self.position = 0
+        done = set()
+        try:
+            with open(self.results_path, 'r') as f:
+                for line in f:
+                    try:
+                        offset = json.loads(line)['offset']
+                    except (ValueError, KeyError):
+                        continue  # Record cut short by a crash
+                    if offset >= self.position:
+                        done.add(offset)
+        except FileNotFoundError:
+            pass
+        return done
+
+    def save_offset(self):
+        """Persist the offset before which every job has completed."""
+        offset = min(self.pending) if self.pending else self.position
+        def write(path):
+            with open(path, 'w') as f:
+                json.dump({'offset': offset}, f)
+                f.flush()
+                os.fsync(f.fileno())
+        replace_atomic(self.offset_path, write)
+
+    def record(self, offset, result):
+        """Append a completion record and advance the saved offset."""
+        result = dict(result, offset=offset, completed=datetime.now().isoformat(timespec='seconds'))
+        with self._lock:
+            with open(self.results_path, 'a') as f:
+                f.write(json.dumps(result) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.pending.discard(offset)
+            self.save_offset()
+
+    def finished(self, job):
+        """RenderService callback: record the job's outcome."""
+        with self._lock:
+            offset = self.job_offsets.pop(job.id)
+        self.record(offset, job.to_dict())
+        print(f"{'✓' if job.status == 'done' else '✗'} Job {job.id}: {job.rendered} cards, "
+              f"{job.failed} failed ({job.to_dict()['cards_per_sec']} cards/sec)")
+
+    def submit(self, offset, line):
+        """Parse one spool line and queue its job; invalid lines are completed straight away."""
+        try:
+            request = json.loads(line)
+            roster = request['roster']
+            output_format = request.get('format', self.default_format)
+            if output_format not in FORMATS:
+                raise ValueError(f"Unknown format {output_format!r} (expected one of {', '.join(FORMATS)})")
+            if not os.path.exists(roster):
+                raise FileNotFoundError(f"Roster not found: {roster}")
+            # Spool offsets make stable job ids, so a re-run after a crash reuses the same folder
+            job_id = str(request.get('id') or f"spool-{offset}")
+            if job_id in self.job_offsets:
+                raise ValueError(f"Job {job_id} is still running")
+            service = self.service_for(request.get('layout', self.config_path), output_format)
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            error = f"Missing field: {e}" if isinstance(e, KeyError) else str(e)
+            print(f"✗ Spool line at offset {offset} rejected: {error}")
+            self.record(offset, {'id': None, 'status': 'invalid', 'message': error})
+            return
+
+        with self._lock:
+            self.pending.add(offset)
+            self.job_offsets[job_id] = offset
+        service.submit(roster, request.get('department'), job_id, request.get('output'))
+
+    def read_new_lines(self, done):
+        """Submit every complete line appended since the last read."""
+        try:
+            with open(self.spool_path, 'rb') as f:
+                f.seek(self.position)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        # A line without its newline is still being written
+        end = data.rfind(b'\n') + 1
+        offset = self.position
+        for line in data[:end].splitlines(keepends=True):
+            if line.strip() and offset not in done:
+                self.submit(offset, line)
+            offset += len(line)
+        with self._lock:
+            self.position = offset
+
+    def run(self):
+        """Recover, then tail the spool until interrupted."""
+        done = self.recover()
+        self.service_for(self.config_path, self.default_format)
+        print(f"✓ Watching {self.spool_path} from offset {self.position} ({len(done)} jobs already completed)")
+        try:
+            while True:
+                self.read_new_lines(done)
+                time.sleep(self.poll_interval)
+        except KeyboardInterrupt:
+            print("\nStopping - unfinished jobs are picked up again on the next start")
+        finally:
+            for service in self.services.values():
+                service.shutdown()
+
+
+if __name__ == "__main__":
+    JobDaemon(spool_path=sys.argv[1] if len(sys.argv) > 1 else None).run()
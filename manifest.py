@@ -0,0 +1,357 @@
+"""
+Output Manifest - Content hashes of generated cards for incremental runs
+
+The manifest lives in the output folder and records, for every roll number,
+a hash of the strings drawn on its card and the file it was saved to (path
+relative to the folder, format and size in bytes). It doubles as the index
+of the folder: later stages find a card through the manifest instead of
+probing the disk. The whole manifest is tied to a fingerprint of everything else that changes the
+pixels (template, font, coordinates, render settings); when the fingerprint
+changes, every card is treated as new.
+
+The manifest is only rewritten at the end of a run. While a run is going,
+each finished card is appended to a checkpoint journal instead, so a run
+that dies halfway can be resumed from the last card it completed.
+
+Cards are either saved flat in the output folder or sharded into
+subfolders, which keeps directories small past ~100k cards:
+- "prefix": by the letters and year a roll number starts with (CS2021001 -> CS/2021/)
+- "hash": by a hash of the filename into 256 folders, used as well for
+  roll numbers the prefix layout does not recognise
+
+TIME COMPLEXITY ANALYSIS:
+- load() / save(): O(n) - n = cards in the manifest
+- is_current(), update(): O(1) per card
+- CheckpointJournal.record(): O(1) per card, one appended line; one disk
+  sync per JOURNAL_SYNC_INTERVAL cards
+
+SPACE COMPLEXITY ANALYSIS:
+- O(n) - one entry (digest, filename, path, format, size) per card
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+from typing import NamedTuple, Optional
+
+MANIFEST_VERSION = 2
+OUTPUT_LAYOUTS = ('flat', 'prefix', 'hash')
+SHARD_PREFIX_PATTERN = re.compile(r'([A-Za-z]+)[-_/]?(\d{4})')  # CS2021001, CS-2021-001 -> CS, 2021
+SHARD_LETTERS_PATTERN = re.compile(r'[A-Z]+')  # First level of a prefix folder (CS/)
+SHARD_YEAR_PATTERN = re.compile(r'\d{4}')      # Second level of a prefix folder (CS/2021/)
+SHARD_HASH_PATTERN = re.compile(r'[0-9a-f]{2}')  # Hash folders, also the prefix layout's fallback
+TEMP_FILE_PATTERN = re.compile(r'(.+)\.\d+-\d+\.tmp')  # <card file>.<pid>-<thread>.tmp of replace_atomic()
+JOURNAL_SYNC_INTERVAL = 256  # Cards between disk syncs of the card files and journal
+
+
+def fingerprint(paths, settings):
+    """Hash the contents of the given files plus the JSON-serialisable settings."""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    digest.update(json.dumps(settings, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def render_fingerprint(config, coordinates):
+    """Fingerprint of everything besides the row itself that changes a card's file.
+
+    Shared by the CLI, the GUI, the service and the upload watcher, so they
+    agree on which manifests and journals still match. Every setting that
+    changes the output is hashed, defaults included.
+    """
+    font_path = config['font']['path']
+    optimization = config.get('optimization', {})
+    paths = [config['paths']['template']] + ([font_path] if os.path.exists(font_path) else [])
+    settings = {'coordinates': coordinates, 'fields': config['fields'], 'font_size': config['font']['size'],
+                'font_color': config['font']['color'], 'formats': config.get('formats', {'semester': 'roman'}),
+                'optimize': optimization.get('enabled', True), 'quality': optimization.get('quality', 85),
+                'compress_level': optimization.get('compress_level', 6),
+                'encoder': optimization.get('encoder', 'pillow'), 'layout': config.get('output', {}).get('layout', 'flat'),
+                'color_mode': optimization.get('color_mode', 'rgb'), 'palette_colors': optimization.get('palette_colors', 16),
+                'threshold': optimization.get('threshold', 128)}
+    return fingerprint(paths, settings)
+
+
+def replace_atomic(output_file, write, sync=True):
+    """Call write(temp path), then rename the temp file over output_file.
+
+    A card file therefore either holds a complete image or does not exist.
+    With sync the temp file is flushed to disk before the rename, which
+    state and index files need to survive a power cut. Cards pass
+    sync=False: they are flushed in batches by CheckpointJournal and
+    OutputManifest.save() instead of one fsync per card.
+    """
+    temp_file = f"{output_file}.{os.getpid()}-{threading.get_ident()}.tmp"
+    try:
+        write(temp_file)
+        if sync:
+            # Opened for writing, which Windows needs to fsync
+            with open(temp_file, 'r+b') as f:
+                os.fsync(f.fileno())
+        os.replace(temp_file, output_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+
+
+def sync_files(paths):
+    """Flush written files to disk: one os.sync() where there is one, else an fsync per file."""
+    if hasattr(os, 'sync'):
+        os.sync()
+        return
+    for path in paths:
+        try:
+            with open(path, 'r+b') as f:
+                os.fsync(f.fileno())
+        except FileNotFoundError:
+            pass  # Deleted since, e.g. a stale card
+
+
+def shard_folder(filename, layout='flat'):
+    """Folder of a card relative to the output folder ('/'-separated, '' when flat)."""
+    if layout == 'prefix':
+        match = SHARD_PREFIX_PATTERN.match(filename)
+        if match:
+            return f"{match.group(1).upper()}/{match.group(2)}"
+        layout = 'hash'
+    if layout == 'hash':
+        return hashlib.blake2b(filename.encode('utf-8'), digest_size=1).hexdigest()
+    return ''
+
+
+def card_path(filename, extension, layout='flat'):
+    """Path of a card file relative to the output folder."""
+    folder = shard_folder(filename, layout)
+    return f"{folder}/{filename}.{extension}" if folder else f"{filename}.{extension}"
+
+
+def list_output_files(output_dir, layout='flat'):
+    """Relative paths of the files in an output folder, like card_path() returns them.
+
+    One listdir() for the flat layout, plus one per shard folder otherwise,
+    instead of a stat per card. Only folders shard_folder() can produce are
+    listed, so other folders kept in the output folder (service jobs,
+    watched batches) are left alone.
+    """
+    if layout == 'flat':
+        return set(os.listdir(output_dir))
+    files = set()
+    folders = []
+    with os.scandir(output_dir) as entries:
+        for entry in entries:
+            if not entry.is_dir():
+                files.add(entry.name)
+            elif SHARD_HASH_PATTERN.fullmatch(entry.name):
+                folders.append(entry.name)
+            elif layout == 'prefix' and SHARD_LETTERS_PATTERN.fullmatch(entry.name):
+                with os.scandir(entry.path) as years:
+                    folders.extend(f"{entry.name}/{year.name}" for year in years
+                                   if year.is_dir() and SHARD_YEAR_PATTERN.fullmatch(year.name))
+    for folder in folders:
+        with os.scandir(os.path.join(output_dir, folder)) as entries:
+            files.update(f"{folder}/{entry.name}" for entry in entries if not entry.is_dir())
+    return files
+
+
+def card_temp_files(files, extension, layout='flat'):
+    """The temp files replace_atomic() left behind for cards, among list_output_files() paths."""
+    temp_files = []
+    for path in files:
+        match = TEMP_FILE_PATTERN.fullmatch(path)
+        if not match:
+            continue
+        stem, _, file_extension = match.group(1).rpartition('.')
+        filename = stem.rpartition('/')[2]
+        if file_extension == extension and card_path(filename, extension, layout) == match.group(1):
+            temp_files.append(path)
+    return temp_files
+
+
+def card_digest(texts, filename):
+    """Hash of everything a card's pixels and location depend on, besides the fingerprint."""
+    return hashlib.blake2b('\x1f'.join(texts + (filename,)).encode('utf-8'), digest_size=16).hexdigest()
+
+
+class ManifestEntry(NamedTuple):
+    """One card of the manifest; path, format and size are None in manifests of version 1."""
+    digest: str
+    filename: str
+    path: Optional[str] = None
+    format: Optional[str] = None
+    size: Optional[int] = None
+
+    def file_path(self, extension):
+        """Path of the card relative to the output folder."""
+        return self.path or f"{self.filename}.{extension}"
+
+
+class OutputManifest:
+    """Roll number -> ManifestEntry for one output folder."""
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.cards = {}
+        self.previous = {}
+        self.reset = False
+        self._unsynced = []    # Card files updated since load(), flushed by save()
+
+    def load(self):
+        """Read the previous manifest; it only counts if the fingerprint still matches."""
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (ValueError, OSError):
+            self.reset = True
+            return
+        if data.get('version') not in (1, MANIFEST_VERSION):
+            self.reset = True
+            return
+        # Entries of an outdated fingerprint still tell which files are stale
+        self.reset = data.get('fingerprint') != self.fingerprint
+        self.previous = {key: ManifestEntry(*entry) for key, entry in data.get('cards', {}).items()}
+
+    def is_current(self, key, digest, existing_files, extension):
+        """True if the card was generated from the same content and its file is still there."""
+        entry = self.previous.get(key)
+        if self.reset or entry is None or entry.digest != digest or entry.file_path(extension) not in existing_files:
+            return False
+        if entry.path is None:
+            # Version 1 entry: the file was found flat in the folder, its size is not known
+            entry = entry._replace(path=entry.file_path(extension), format=extension)
+        self.cards[key] = entry
+        return True
+
+    def update(self, key, digest, filename, path=None, size=None):
+        """Record a card written in this run (path relative to the output folder)."""
+        output_format = os.path.splitext(path)[1][1:] if path else None
+        self.cards[key] = ManifestEntry(digest, filename, path, output_format, size)
+        if path is not None:
+            self._unsynced.append(os.path.join(os.path.dirname(self.path), path))
+
+    def stale(self, seen, extension):
+        """[(roll number, path)] of previous cards whose student is no longer in the roster."""
+        return [(key, entry.file_path(extension)) for key, entry in self.previous.items() if key not in seen]
+
+    def save(self):
+        """Write the manifest atomically (temp file + rename), after the cards it lists."""
+        sync_files(self._unsynced)
+        self._unsynced = []
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'version': MANIFEST_VERSION, 'fingerprint': self.fingerprint,
+                       'cards': {key: list(entry) for key, entry in self.cards.items()}}, f)
+            # On disk before the rename, as the journal it replaces is deleted next
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+
+class CheckpointJournal:
+    """Append-only log of the cards finished by the current run.
+
+    The first line holds the render fingerprint, then one JSON line per card
+    whose file has been written (and renamed into place). Lines are flushed
+    as they are written. Every JOURNAL_SYNC_INTERVAL cards, the card files
+    and then the journal are synced to disk and a {"synced": true} line is
+    appended; a resume only trusts the cards before the last such line, as
+    the files of later ones may not have reached the disk. Up to
+    JOURNAL_SYNC_INTERVAL cards are thus rendered again after a crash.
+    """
+
+    def __init__(self, path, fingerprint):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.file = None
+        self._unsynced = []    # Card files journalled since the last sync
+        self._lock = threading.Lock()
+
+    def load(self):
+        """Return {roll number: (digest, filename, size)} of a previous run with the same fingerprint.
+
+        Returns None if there is no journal or it belongs to different settings.
+        """
+        done = {}
+        unsynced = {}
+        try:
+            with open(self.path, 'r') as f:
+                header = f.readline()
+                if not header or json.loads(header).get('fingerprint') != self.fingerprint:
+                    return None
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # Line cut short by a crash
+                    if entry.get('synced'):
+                        done.update(unsynced)
+                        unsynced.clear()
+                    else:
+                        unsynced[entry['roll']] = (entry['digest'], entry['file'], entry.get('size'))
+        except FileNotFoundError:
+            return None
+        except (ValueError, OSError):
+            return None
+        return done
+
+    def open(self, resume=False):
+        """Start a journal, or keep appending to the previous one when resuming."""
+        if resume and self.load() is not None:
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                complete = f.read(1) == b'\n'
+            self.file = open(self.path, 'a')
+            if not complete:
+                # Terminate the line cut short by the crash before appending
+                self.file.write('\n')
+            return
+        self.file = open(self.path, 'w')
+        self.file.write(json.dumps({'fingerprint': self.fingerprint}) + '\n')
+        self.file.flush()
+
+    def record(self, key, digest, filename, size=None, path=None):
+        """Append one finished card, with its file size so a resume needn't stat it.
+
+        path is the card file, synced to disk with the next batch.
+        """
+        with self._lock:
+            self.file.write(json.dumps({'roll': key, 'digest': digest, 'file': filename, 'size': size}) + '\n')
+            self.file.flush()
+            self._unsynced.append(path)
+            if len(self._unsynced) >= JOURNAL_SYNC_INTERVAL:
+                self._sync()
+
+    def _sync(self):
+        # Cards first, so a card is never trusted before its file is on disk
+        sync_files([path for path in self._unsynced if path is not None])
+        os.fsync(self.file.fileno())
+        self.file.write(json.dumps({'synced': True}) + '\n')
+        self.file.flush()
+        self._unsynced = []
+
+    def close(self):
+        """Sync the cards journalled so far and close the journal, keeping it for a resume."""
+        if self.file is not None:
+            with self._lock:
+                if self._unsynced:
+                    self._sync()
+            self._close()
+
+    def _close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def remove(self):
+        """Delete the journal once the run has completed and the manifest is saved."""
+        self._close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
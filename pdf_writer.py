@@ -0,0 +1,336 @@
+"""
+PDF Writer - Minimal PDF writer for admit card output
+
+Objects are written to the file as soon as they are added and only their
+byte offsets are kept, so the xref table and trailer can be written at the
+end. Object numbers can be reserved up front for objects (the page tree,
+the font) that are only complete once every page is known.
+
+Memory stays flat however many pages are written: image pages hold one
+card at a time, and JPEG cards are copied into the file without decoding.
+Bilevel cards saved as single-strip CCITT Group 4 TIFFs are copied the
+same way (the PDF CCITTFaxDecode filter reads Group 4 data as it is), and
+so are the zlib streams of palette, grey and RGB PNGs (FlateDecode with
+the PNG predictors), palette cards staying indexed.
+
+TIME COMPLEXITY ANALYSIS:
+- add_page(): O(c) - c = size of the page content stream
+- add_image_page(): O(s) - s = size of the image file
+- close(): O(p + f) - p = number of pages, f = size of the embedded font
+
+SPACE COMPLEXITY ANALYSIS:
+- Offsets and page ids: O(p) integers, page content is never retained
+"""
+
+import io
+import os
+import re
+import struct
+import zlib
+from PIL import Image, ImageFont
+
+try:
+    from fontTools import subset as font_subset
+    FONT_SUBSET_SUPPORT = True
+except ImportError:
+    FONT_SUBSET_SUPPORT = False
+
+# Pillow font sizes are in pixels, PDF units are points (72 dpi vs 96 dpi)
+PX_TO_PT = 72 / 96
+
+# TIFF tags read to pass Group 4 data through
+PHOTOMETRIC, FILL_ORDER, STRIP_OFFSETS, STRIP_BYTE_COUNTS = 262, 266, 273, 279
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+PNG_COLORS = {0: 1, 2: 3, 3: 1}  # PNG colour type (grey, RGB, palette) -> components per pixel
+
+
+def read_png(path):
+    """Return (IHDR fields, palette bytes, concatenated IDAT data) of a PNG, or None.
+
+    None for PNGs whose data a PDF cannot take as it is: interlaced, with
+    alpha or transparency, or 16 bits per sample.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    if not data.startswith(PNG_SIGNATURE):
+        return None
+    header, palette, idat = None, b'', []
+    position = len(PNG_SIGNATURE)
+    while position + 8 <= len(data):
+        length, kind = struct.unpack('>I4s', data[position:position + 8])
+        body = data[position + 8:position + 8 + length]
+        position += 12 + length
+        if kind == b'IHDR':
+            header = struct.unpack('>IIBBBBB', body)
+        elif kind == b'PLTE':
+            palette = body
+        elif kind == b'IDAT':
+            idat.append(body)
+        elif kind == b'tRNS':
+            return None
+        elif kind == b'IEND':
+            break
+    if header is None:
+        return None
+    width, height, bit_depth, color_type, _, _, interlace = header
+    if color_type not in PNG_COLORS or interlace or bit_depth > 8 or (color_type == 3 and not palette):
+        return None
+    return header, palette, b''.join(idat)
+
+
+def pdf_string(text):
+    """Encode text as a WinAnsi PDF literal string."""
+    data = text.encode('cp1252', 'replace')
+    return b'(' + data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)') + b')'
+
+
+class PDFWriter:
+    """Write a PDF object by object to an open file.
+
+    Used as a context manager, the file is finished on success and deleted
+    if an exception cuts the PDF short.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, 'wb')
+        self.offsets = {}
+        self.page_ids = []
+        self._next_id = 1
+        self.catalog_id = self.reserve()
+        self.pages_id = self.reserve()
+        self.file.write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+
+    def reserve(self):
+        """Reserve an object number to be written later."""
+        obj_id = self._next_id
+        self._next_id += 1
+        return obj_id
+
+    def write_object(self, obj_id, body):
+        """Write object obj_id with the given body (bytes or str)."""
+        if isinstance(body, str):
+            body = body.encode('latin-1')
+        self.offsets[obj_id] = self.file.tell()
+        self.file.write(b'%d 0 obj\n' % obj_id + body + b'\nendobj\n')
+        return obj_id
+
+    def write_stream(self, obj_id, entries, data, compress=True):
+        """Write a stream object. entries is the dictionary body without << >>."""
+        if compress:
+            data = zlib.compress(data)
+            entries += ' /Filter /FlateDecode'
+        return self.write_object(obj_id, b'<< ' + entries.encode('latin-1') + b' /Length %d >>\nstream\n' % len(data)
+                                 + data + b'\nendstream')
+
+    def add_jpeg(self, data, width, height, mode='RGB'):
+        """Embed JPEG bytes as an image XObject without re-encoding."""
+        colorspace = '/DeviceGray' if mode == 'L' else '/DeviceRGB'
+        return self.write_stream(self.reserve(), f'/Type /XObject /Subtype /Image /Width {width} /Height {height} '
+                                 f'/ColorSpace {colorspace} /BitsPerComponent 8 /Filter /DCTDecode', data, compress=False)
+
+    def add_ccitt(self, data, width, height, black_is_1=False):
+        """Embed CCITT Group 4 data as a 1-bit image XObject without re-encoding."""
+        return self.write_stream(self.reserve(), f'/Type /XObject /Subtype /Image /Width {width} /Height {height} '
+                                 f'/ColorSpace /DeviceGray /BitsPerComponent 1 /Filter /CCITTFaxDecode '
+                                 f'/DecodeParms << /K -1 /Columns {width} /Rows {height} '
+                                 f'/BlackIs1 {"true" if black_is_1 else "false"} >>', data, compress=False)
+
+    def add_png(self, header, palette, data):
+        """Embed PNG image data (see read_png()) without decoding it."""
+        width, height, bit_depth, color_type = header[:4]
+        if color_type == 3:
+            colorspace = f'[/Indexed /DeviceRGB {len(palette) // 3 - 1} <{palette.hex()}>]'
+        else:
+            colorspace = '/DeviceGray' if color_type == 0 else '/DeviceRGB'
+        return self.write_stream(self.reserve(), f'/Type /XObject /Subtype /Image /Width {width} /Height {height} '
+                                 f'/ColorSpace {colorspace} /BitsPerComponent {bit_depth} /Filter /FlateDecode '
+                                 f'/DecodeParms << /Predictor 15 /Colors {PNG_COLORS[color_type]} '
+                                 f'/BitsPerComponent {bit_depth} /Columns {width} >>', data, compress=False)
+
+    def add_image(self, img):
+        """Embed a PIL image as a Flate-compressed image XObject."""
+        if img.mode == '1':
+            # Packed rows, 1 = white as in DeviceGray
+            return self.write_stream(self.reserve(), f'/Type /XObject /Subtype /Image /Width {img.size[0]} /Height {img.size[1]} '
+                                     f'/ColorSpace /DeviceGray /BitsPerComponent 1', img.tobytes())
+        if img.mode == 'P' and 'transparency' not in img.info:
+            # One byte per pixel plus the palette, instead of three
+            palette = img.getpalette()[:3 * (max(img.getextrema()[1], 0) + 1)]
+            colorspace = f'[/Indexed /DeviceRGB {len(palette) // 3 - 1} <{bytes(palette).hex()}>]'
+            return self.write_stream(self.reserve(), f'/Type /XObject /Subtype /Image /Width {img.size[0]} /Height {img.size[1]} '
+                                     f'/ColorSpace {colorspace} /BitsPerComponent 8', img.tobytes())
+        if img.mode not in ('RGB', 'L'):
+            # Flatten transparency onto white
+            rgba = img.convert('RGBA')
+            img = Image.new('RGB', img.size, (255, 255, 255))
+            img.paste(rgba, mask=rgba.split()[-1])
+        colorspace = '/DeviceGray' if img.mode == 'L' else '/DeviceRGB'
+        return self.write_stream(self.reserve(), f'/Type /XObject /Subtype /Image /Width {img.size[0]} /Height {img.size[1]} '
+                                 f'/ColorSpace {colorspace} /BitsPerComponent 8', img.tobytes())
+
+    def add_image_file(self, path):
+        """Embed an image file, passing JPEG, PNG and single-strip Group 4 TIFF data through untouched.
+
+        Returns (object id, (width, height)).
+        """
+        with Image.open(path) as img:
+            if img.format == 'JPEG' and img.mode in ('RGB', 'L'):
+                size, mode = img.size, img.mode
+                with open(path, 'rb') as f:
+                    return self.add_jpeg(f.read(), size[0], size[1], mode), size
+            if (img.format == 'TIFF' and img.info.get('compression') == 'group4'
+                    and len(img.tag_v2.get(STRIP_OFFSETS, ())) == 1 and img.tag_v2.get(FILL_ORDER, 1) == 1):
+                with open(path, 'rb') as f:
+                    f.seek(img.tag_v2[STRIP_OFFSETS][0])
+                    data = f.read(img.tag_v2[STRIP_BYTE_COUNTS][0])
+                # Photometric 1 (BlackIsZero): the coded "white" runs are the black pixels
+                return self.add_ccitt(data, img.size[0], img.size[1], img.tag_v2.get(PHOTOMETRIC, 0) == 1), img.size
+            if img.format == 'PNG':
+                png = read_png(path)
+                if png is not None:
+                    return self.add_png(*png), img.size
+            img.load()
+            return self.add_image(img), img.size
+
+    def add_page(self, width, height, content, xobjects=None, fonts=None):
+        """Write a page of width x height points with the given content stream."""
+        resources = ''
+        if xobjects:
+            resources += ' /XObject << ' + ' '.join(f'/{name} {obj_id} 0 R' for name, obj_id in xobjects.items()) + ' >>'
+        if fonts:
+            resources += ' /Font << ' + ' '.join(f'/{name} {obj_id} 0 R' for name, obj_id in fonts.items()) + ' >>'
+        content_id = self.write_stream(self.reserve(), '', content)
+        page_id = self.write_object(self.reserve(), f'<< /Type /Page /Parent {self.pages_id} 0 R '
+                                    f'/MediaBox [0 0 {width:.2f} {height:.2f}] /Resources <<{resources} >> '
+                                    f'/Contents {content_id} 0 R >>')
+        self.page_ids.append(page_id)
+        return page_id
+
+    def add_image_page(self, path):
+        """Add a page showing one image file at 96 dpi."""
+        image_id, (width, height) = self.add_image_file(path)
+        width_pt, height_pt = width * PX_TO_PT, height * PX_TO_PT
+        content = f'q {width_pt:.2f} 0 0 {height_pt:.2f} 0 0 cm /Im0 Do Q'.encode('latin-1')
+        return self.add_page(width_pt, height_pt, content, xobjects={'Im0': image_id})
+
+    def close(self):
+        """Write the page tree, catalog, xref table and trailer."""
+        kids = ' '.join(f'{page_id} 0 R' for page_id in self.page_ids)
+        self.write_object(self.pages_id, f'<< /Type /Pages /Kids [{kids}] /Count {len(self.page_ids)} >>')
+        self.write_object(self.catalog_id, f'<< /Type /Catalog /Pages {self.pages_id} 0 R >>')
+
+        xref_offset = self.file.tell()
+        count = self._next_id
+        lines = [f'xref\n0 {count}\n', '0000000000 65535 f \n']
+        for obj_id in range(1, count):
+            if obj_id in self.offsets:
+                lines.append(f'{self.offsets[obj_id]:010d} 00000 n \n')
+            else:
+                lines.append('0000000000 65535 f \n')
+        lines.append(f'trailer\n<< /Size {count} /Root {self.catalog_id} 0 R >>\nstartxref\n{xref_offset}\n%%EOF\n')
+        self.file.write(''.join(lines).encode('latin-1'))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def abort(self):
+        """Close and delete an unfinished PDF (it has no xref table, so no reader can open it)."""
+        self.file.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class OrderedPageSink:
+    """Add card pages to a PDFWriter in roster order while cards finish out of order.
+
+    Only cards that finished ahead of an earlier, still-rendering card are
+    held back (as file paths), so memory is bounded by the work in flight.
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.next_index = 0
+        self.pages = 0
+        self._ready = {}
+
+    def add(self, index, image_path):
+        """Report card index as done; image_path is None for a failed card."""
+        self._ready[index] = image_path
+        while self.next_index in self._ready:
+            path = self._ready.pop(self.next_index)
+            if path is not None:
+                self.writer.add_image_page(path)
+                self.pages += 1
+            self.next_index += 1
+
+
+class EmbeddedTrueTypeFont:
+    """A TrueType font embedded once as a WinAnsi simple font.
+
+    Characters are recorded as text is shown; the font program is written on
+    finish(), subset to those characters when fontTools is installed.
+    """
+
+    def __init__(self, writer, font_path):
+        with open(font_path, 'rb') as f:
+            self.font_data = f.read()
+        if self.font_data[:4] not in (b'\x00\x01\x00\x00', b'true'):
+            raise ValueError("Vector PDF output needs a TrueType (.ttf) font")
+        self.writer = writer
+        self.font_path = font_path
+        self.obj_id = writer.reserve()
+        self.used_chars = set()
+        # Metrics in PDF glyph space (1000 units per em)
+        self.metrics_font = ImageFont.truetype(font_path, 1000)
+
+    def show(self, text):
+        """Record the characters of text and return it as a PDF string operand."""
+        self.used_chars.update(text.encode('cp1252', 'replace').decode('cp1252'))
+        return pdf_string(text)
+
+    def finish(self):
+        """Write the font dictionary, descriptor, widths and font program."""
+        family, style = self.metrics_font.getname()
+        base_name = re.sub(r'[^A-Za-z0-9-]', '', f"{family}-{style}") or 'Font'
+        font_data = self.font_data
+        if FONT_SUBSET_SUPPORT and self.used_chars:
+            options = font_subset.Options()
+            options.notdef_outline = True
+            options.layout_features = []
+            tt_font = font_subset.load_font(self.font_path, options)
+            subsetter = font_subset.Subsetter(options)
+            subsetter.populate(unicodes=[ord(char) for char in self.used_chars])
+            subsetter.subset(tt_font)
+            buffer = io.BytesIO()
+            tt_font.save(buffer)
+            font_data = buffer.getvalue()
+            # Subset fonts are tagged with six uppercase letters
+            tag = ''.join(chr(ord('A') + (zlib.crc32(font_data) >> (5 * i)) % 26) for i in range(6))
+            base_name = f"{tag}+{base_name}"
+
+        widths = []
+        for code in range(32, 256):
+            try:
+                char = bytes([code]).decode('cp1252')
+                widths.append(str(round(self.metrics_font.getlength(char))))
+            except UnicodeDecodeError:
+                widths.append('0')
+        ascent, descent = self.metrics_font.getmetrics()
+
+        file_id = self.writer.write_stream(self.writer.reserve(), f'/Length1 {len(font_data)}', font_data)
+        descriptor_id = self.writer.write_object(self.writer.reserve(),
+            f'<< /Type /FontDescriptor /FontName /{base_name} /Flags 32 /FontBBox [-500 {-descent} 1500 {ascent}] '
+            f'/ItalicAngle 0 /Ascent {ascent} /Descent {-descent} /CapHeight {ascent} /StemV 80 '
+            f'/FontFile2 {file_id} 0 R >>')
+        self.writer.write_object(self.obj_id,
+            f'<< /Type /Font /Subtype /TrueType /BaseFont /{base_name} /FirstChar 32 /LastChar 255 '
+            f'/Widths [{" ".join(widths)}] /Encoding /WinAnsiEncoding /FontDescriptor {descriptor_id} 0 R >>')
@@ -0,0 +1,428 @@
+"""
+Render Service - Local HTTP service that renders uploaded rosters as jobs
+
+Departments upload a roster CSV; it is saved to uploads/ and queued as a
+job. Jobs run on one process pool that is started and warmed up with the
+service, so every worker keeps its decoded template, font and text cache
+between jobs instead of paying for them per roster. Cards of a job are
+saved to output/jobs/<job id>/.
+
+Single cards are rendered on demand, straight into memory, from the
+configured roster. Encoded cards are kept in a byte-bounded LRU keyed by a
+strong ETag (hash of the student's texts plus the layout fingerprint), so
+repeat downloads are served from memory or answered with 304.
+
+    python render_service.py                      # http://127.0.0.1:5000
+
+    POST /jobs          form field "roster" (CSV file), optional "department"
+    GET  /jobs          every job, newest first
+    GET  /jobs/<id>     status, progress and throughput of one job
+    GET  /cards/<roll>  one student's card by roll or reg no. (ETag / If-None-Match aware)
+    GET  /stats         queue length, pool size, card cache and service throughput
+
+TIME COMPLEXITY ANALYSIS:
+- POST /jobs: O(s) - s = size of the uploaded file (written to disk)
+- A job: O(n) cards spread over the worker pool
+- GET /jobs/<id>, /stats: O(1)
+- GET /cards/<roll>: O(1) on a cache hit or 304, one card render on a miss
+
+SPACE COMPLEXITY ANALYSIS:
+- One CSV chunk plus max_in_flight card batches per running job
+- Card cache: at most card_cache_mb of encoded cards, roster index O(n)
+"""
+
+import hashlib
+import json
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+import pandas as pd
+from flask import Flask, Response, jsonify, request
+from roster import prepare_cards, RosterIndex
+from manifest import render_fingerprint, card_digest, list_output_files, card_temp_files
+from renderer import AdmitCardRenderer, init_process_worker, render_chunk, warm_up_worker
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "config.json")
+THROUGHPUT_WINDOW = 60  # Seconds of completed cards behind the service's cards/sec
+MAX_JOB_ERRORS = 20     # Failed rows listed per job (all are counted)
+
+
+def load_service_config(config_path=CONFIG_FILE):
+    """Return (config, coordinates) for the service."""
+    with open(config_path, 'r') as f:
+        config = json.load(f)
+    with open(config['paths']['coordinates'], 'r') as f:
+        coordinates = json.load(f)
+    return config, coordinates
+
+
+class EncodedCardCache:
+    """Thread-safe LRU of encoded card files, bounded by their total size in bytes."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, etag):
+        with self._lock:
+            data = self._entries.get(etag)
+            if data is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(etag)
+            self.hits += 1
+            return data
+
+    def put(self, etag, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if etag in self._entries:
+                return
+            self._entries[etag] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'mb': round(self.size / (1024 * 1024), 1),
+                    'hits': self.hits, 'misses': self.misses}
+
+
+class RosterLookup:
+    """Roll or registration number -> CardRecord, read through the roster's sidecar index."""
+
+    def __init__(self, path, fields, formats):
+        self.index = RosterIndex(path)
+        self.fields = fields
+        self.formats = formats
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the student's CardRecord, or None if not in the roster (or not drawable)."""
+        # The index reloads itself when the roster changes; one thread at a time does that
+        with self._lock:
+            chunk = self.index.lookup(key)
+        if chunk is None:
+            return None
+        cards, _ = prepare_cards(chunk, self.fields, self.formats)
+        return cards[0] if cards else None
+
+
+class RenderJob:
+    """One uploaded roster and its progress."""
+
+    def __init__(self, roster_path, output_dir, department=None, job_id=None):
+        self.id = job_id or uuid.uuid4().hex[:12]
+        self.roster_path = roster_path
+        self.output_dir = output_dir
+        self.department = department
+        self.status = 'queued'  # queued -> running -> done / failed
+        self.rendered = 0
+        self.failed = 0
+        self.errors = []
+        self.message = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+
+    def to_dict(self):
+        """JSON-serialisable status."""
+        elapsed = ((self.finished or time.time()) - self.started) if self.started else 0
+        return {
+            'id': self.id,
+            'department': self.department,
+            'status': self.status,
+            'roster': os.path.basename(self.roster_path),
+            'output': self.output_dir,
+            'rendered': self.rendered,
+            'failed': self.failed,
+            'errors': self.errors,
+            'message': self.message,
+            'queued_seconds': round((self.started or time.time()) - self.submitted, 2),
+            'elapsed_seconds': round(elapsed, 2),
+            'cards_per_sec': round(self.rendered / elapsed, 1) if elapsed > 0 else 0,
+        }
+
+
+class RenderService:
+    """Job queue in front of a pre-warmed render process pool."""
+
+    def __init__(self, config, coordinates):
+        self.config = config
+        self.coordinates = coordinates
+        service = config.get('service', {})
+        self.workers = service.get('workers', config['performance']['max_workers'])
+        self.job_slots = service.get('job_slots', 2)  # Jobs rendered side by side on the shared pool
+        self.upload_dir = service.get('upload_dir', 'uploads')
+        self.chunk_size = config['performance'].get('chunk_size', 64)
+        self.csv_chunk_size = config['performance'].get('csv_chunk_size', 10000)
+        self.max_in_flight = config['performance'].get('max_in_flight', self.workers * 4)
+        self.formats = config.get('formats', {'semester': 'roman'})
+        self.output_root = os.path.join(config['paths']['output'], 'jobs')
+
+        # On-demand single cards, rendered in this process
+        self.renderer = None
+        self.roster = RosterLookup(service.get('roster', config['paths']['data']), config['fields'], self.formats)
+        self.card_cache = EncodedCardCache(service.get('card_cache_mb', 256) * 1024 * 1024)
+        self.layout_id = None
+        self.not_modified = 0
+        self.on_finish = None  # Called with each RenderJob once it is done or failed
+
+        self.jobs = {}
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._completed = deque()  # (time, cards) of finished batches, for throughput
+        self.cards_rendered = 0
+        self.started = None
+        self.pool = None
+        self._pool_lock = threading.Lock()
+
+    def start(self):
+        """Start the worker pool, warm up every worker and start the job threads."""
+        os.makedirs(self.upload_dir, exist_ok=True)
+        os.makedirs(self.output_root, exist_ok=True)
+        self.renderer = AdmitCardRenderer(self.config, self.coordinates)
+        self.layout_id = render_fingerprint(self.config, self.coordinates)
+        self._start_pool()
+        for _ in range(self.job_slots):
+            threading.Thread(target=self._job_loop, daemon=True).start()
+        self.started = time.time()
+
+    def _start_pool(self):
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=init_process_worker,
+                                        initargs=(self.config, self.coordinates))
+        # One slow warm-up task per worker, so each one decodes the template before the first job
+        pids = {future.result() for future in [self.pool.submit(warm_up_worker, 0.2) for _ in range(self.workers)]}
+        print(f"✓ Render pool ready: {len(pids)} workers")
+
+    def shutdown(self):
+        if self.pool is not None:
+            self.pool.shutdown(cancel_futures=True)
+
+    def store_upload(self, upload):
+        """Save an uploaded roster under a new name in the upload folder and return its path.
+
+        The roster is written to an exclusively created <name>.part file and
+        renamed into place once complete, so a watcher of the folder only
+        ever sees whole rosters, and uploads arriving in the same second
+        never share a name.
+        """
+        stamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        n = 1
+        with self._lock:
+            while True:
+                suffix = f"_{n}" if n > 1 else ''
+                path = os.path.join(self.upload_dir, f"students_{stamp}{suffix}.csv")
+                if not os.path.exists(path):
+                    try:
+                        part = open(path + '.part', 'xb')
+                        break
+                    except FileExistsError:
+                        pass
+                n += 1
+        try:
+            with part:
+                upload.save(part)
+            os.replace(part.name, path)
+        except BaseException:
+            os.remove(part.name)
+            raise
+        return path
+
+    def submit(self, roster_path, department=None, job_id=None, output_dir=None):
+        """Queue a roster for rendering and return its RenderJob.
+
+        Cards go to output_dir, by default output/jobs/<job id>/.
+        """
+        job = RenderJob(roster_path, None, department, job_id)
+        job.output_dir = output_dir or os.path.join(self.output_root, job.id)
+        with self._lock:
+            self.jobs[job.id] = job
+        self._queue.put(job)
+        return job
+
+    def _job_loop(self):
+        while True:
+            job = self._queue.get()
+            pool = self.pool
+            try:
+                self._run(job, pool)
+            except BrokenProcessPool as e:
+                job.status, job.message = 'failed', f"Render worker died: {e}"
+                with self._pool_lock:
+                    # Another job thread may already have replaced the broken pool
+                    if self.pool is pool:
+                        print("⚠ Render pool broken, restarting workers")
+                        # Reap the surviving workers and the pool's management thread first
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        self._start_pool()
+            except Exception as e:
+                job.status, job.message = 'failed', str(e)
+            finally:
+                job.finished = time.time()
+                if self.on_finish is not None:
+                    self.on_finish(job)
+
+    def _batches(self, job):
+        """Yield card batches of the roster, recording rows that cannot be drawn."""
+        fields = self.config['fields']
+        batch = []
+        for chunk in pd.read_csv(job.roster_path, dtype={field: str for field in fields}, chunksize=self.csv_chunk_size):
+            cards, failures = prepare_cards(chunk, fields, self.formats)
+            self._record_failures(job, [(failure.name, failure.error) for failure in failures])
+            for card in cards:
+                batch.append(card)
+                if len(batch) >= self.chunk_size:
+                    yield batch
+                    batch = []
+        if batch:
+            yield batch
+
+    def _record_failures(self, job, failures):
+        job.failed += len(failures)
+        room = MAX_JOB_ERRORS - len(job.errors)
+        if room > 0:
+            job.errors.extend({'name': name, 'error': error} for name, error in failures[:room])
+
+    def _collect(self, job, done):
+        for future in done:
+            results, _, _ = future.result()
+            rendered = sum(1 for success, _, _, _ in results if success)
+            job.rendered += rendered
+            self._record_failures(job, [(name, error) for success, name, error, _ in results if not success])
+            with self._lock:
+                self.cards_rendered += rendered
+                self._completed.append((time.time(), rendered))
+
+    def _run(self, job, pool):
+        job.status = 'running'
+        job.started = time.time()
+        os.makedirs(job.output_dir, exist_ok=True)
+        # Temp files left by a run of this job that was killed mid-write
+        existing_files = list_output_files(job.output_dir, self.renderer.output_layout)
+        for name in card_temp_files(existing_files, self.renderer.extension, self.renderer.output_layout):
+            os.remove(os.path.join(job.output_dir, name))
+
+        # At most max_in_flight batches per job, so one big roster cannot flood the pool
+        pending = set()
+        for batch in self._batches(job):
+            if len(pending) >= self.max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                self._collect(job, done)
+            pending.add(pool.submit(render_chunk, batch, job.output_dir))
+        self._collect(job, wait(pending).done)
+        job.status = 'done'
+
+    def card_etag(self, card):
+        """Strong ETag of a card: its texts and filename under the current layout."""
+        return hashlib.blake2b(f"{self.layout_id}:{card_digest(card.texts, card.filename)}".encode('utf-8'),
+                               digest_size=16).hexdigest()
+
+    def card_bytes(self, card, etag):
+        """Encoded card from the cache, rendering it on a miss."""
+        data = self.card_cache.get(etag)
+        if data is None:
+            data = self.renderer.render_bytes(card.texts)
+            self.card_cache.put(etag, data)
+        return data
+
+    def throughput(self):
+        """Cards per second over the last THROUGHPUT_WINDOW seconds."""
+        now = time.time()
+        with self._lock:
+            while self._completed and self._completed[0][0] < now - THROUGHPUT_WINDOW:
+                self._completed.popleft()
+            cards = sum(count for _, count in self._completed)
+        window = min(THROUGHPUT_WINDOW, now - self.started) if self.started else 0
+        return cards / window if window > 0 else 0
+
+    def stats(self):
+        """Service-wide counters."""
+        with self._lock:
+            statuses = [job.status for job in self.jobs.values()]
+        return {
+            'workers': self.workers,
+            'job_slots': self.job_slots,
+            'queued': statuses.count('queued'),
+            'running': statuses.count('running'),
+            'done': statuses.count('done'),
+            'failed': statuses.count('failed'),
+            'cards_rendered': self.cards_rendered,
+            'cards_per_sec': round(self.throughput(), 1),
+            'uptime_seconds': round(time.time() - self.started, 1) if self.started else 0,
+            'card_cache': dict(self.card_cache.stats(), not_modified=self.not_modified),
+        }
+
+
+def create_app(service):
+    """Flask app exposing the service's job queue."""
+    app = Flask(__name__)
+    app.config['MAX_CONTENT_LENGTH'] = service.config.get('service', {}).get('max_upload_mb', 200) * 1024 * 1024
+
+    @app.post('/jobs')
+    def submit_job():
+        upload = request.files.get('roster')
+        if upload is None or not upload.filename:
+            return jsonify({'error': "No roster uploaded (form field 'roster')"}), 400
+        if not upload.filename.lower().endswith('.csv'):
+            return jsonify({'error': "Roster must be a .csv file"}), 400
+        path = service.store_upload(upload)
+        job = service.submit(path, request.form.get('department'))
+        return jsonify(job.to_dict()), 202
+
+    @app.get('/jobs')
+    def list_jobs():
+        jobs = sorted(service.jobs.values(), key=lambda job: job.submitted, reverse=True)
+        return jsonify([job.to_dict() for job in jobs])
+
+    @app.get('/jobs/<job_id>')
+    def job_status(job_id):
+        job = service.jobs.get(job_id)
+        if job is None:
+            return jsonify({'error': "Unknown job"}), 404
+        return jsonify(job.to_dict())
+
+    @app.get('/cards/<path:key>')
+    def card(key):
+        card = service.roster.get(key)
+        if card is None:
+            return jsonify({'error': "Unknown roll or registration number"}), 404
+        etag = service.card_etag(card)
+        headers = {'ETag': f'"{etag}"', 'Cache-Control': 'no-cache',
+                   'Content-Disposition': f'inline; filename="{card.filename}.{service.renderer.extension}"'}
+        if request.if_none_match.contains(etag):
+            with service._lock:
+                service.not_modified += 1
+            return Response(status=304, headers=headers)
+        return Response(service.card_bytes(card, etag), mimetype=service.renderer.mime_type, headers=headers)
+
+    @app.get('/stats')
+    def stats():
+        return jsonify(service.stats())
+
+    return app
+
+
+if __name__ == "__main__":
+    config, coordinates = load_service_config()
+    service = RenderService(config, coordinates)
+    service.start()
+    settings = config.get('service', {})
+    try:
+        # threaded: status requests are answered while uploads are being saved
+        create_app(service).run(host=settings.get('host', '127.0.0.1'), port=settings.get('port', 5000), threaded=True)
+    finally:
+        service.shutdown()
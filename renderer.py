@@ -0,0 +1,731 @@
+"""
+Renderer - Import-light admit card rendering core
+
+AdmitCardRenderer holds everything a card needs besides the student's own
+texts: settings, font, decoded template and the render plan, an immutable
+list of placed fields compiled once from config and coordinates. Importing
+this module has no side effects and only pulls in Pillow; NumPy is imported
+on first use of the glyph atlas engine.
+
+Cards are RGB (saved as JPEG, or PNG without optimization) unless
+optimization.color_mode reduces them: "palette" quantises the template once
+to a few colours and saves palette PNGs, "bilevel" thresholds it to 1-bit
+and saves CCITT Group 4 TIFFs. Text is then drawn straight into the reduced
+image, without anti-aliasing. Config, coordinates and CSV loading
+are left to the caller (generator6.py, generator_gui.py or a job runner).
+
+    from renderer import AdmitCardRenderer
+    renderer = AdmitCardRenderer.from_files("config.json")
+    img = renderer.render(texts)          # texts in config['fields'] order
+
+TIME COMPLEXITY ANALYSIS:
+- AdmitCardRenderer(): O(w * h) - template decoded once per process
+- render(): O(w * h) full mode, O(sum of tile areas) in dirty-rectangle mode
+
+SPACE COMPLEXITY ANALYSIS:
+- One decoded template per process, one working copy per card in flight
+"""
+
+import io
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+from PIL import Image, ImageDraw, ImageFont, ImageChops, ImageColor, TiffImagePlugin
+from manifest import replace_atomic, card_path, OUTPUT_LAYOUTS
+
+DIRTY_RECT_PADDING = 4  # Pixels added around each text_sizes box
+COLOR_MODES = ('rgb', 'palette', 'bilevel')
+MIME_TYPES = {'jpg': 'image/jpeg', 'png': 'image/png', 'tif': 'image/tiff'}
+
+# Decoded templates, keyed by (path, flattened, colour settings). Shared by all renderers and threads of a process.
+_template_cache = {}
+_template_cache_lock = threading.Lock()
+
+
+def output_extension(config):
+    """File extension of the cards a config produces: 'jpg', 'png' or 'tif'."""
+    optimization = config.get('optimization', {})
+    color_mode = optimization.get('color_mode', 'rgb')
+    if color_mode == 'bilevel':
+        return 'tif'
+    if color_mode == 'palette' or not optimization.get('enabled', True):
+        return 'png'
+    return 'jpg'
+
+
+def quantize_template(template, color_mode, colors=16, threshold=128):
+    """Reduce a flattened RGB template to a palette of colors, or to 1-bit at threshold.
+
+    No dithering: forms are flat colours and lines, dither noise would only
+    cost bytes.
+    """
+    if color_mode == 'bilevel':
+        return template.convert('L').point(lambda value: 255 if value >= threshold else 0, '1')
+    return template.quantize(colors, dither=Image.Dither.NONE)
+
+
+def load_template(template_path, flatten=True, color_mode='rgb', colors=16, threshold=128):
+    """Decode the template once per process and return the shared, read-only image.
+
+    With flatten (image optimization enabled) the template is flattened onto
+    white and converted to RGB here, so cards no longer pay for it at save time.
+    A palette or bilevel color_mode then quantises the flattened template.
+    """
+    key = (os.path.abspath(template_path), flatten, color_mode, colors, threshold)
+    template = _template_cache.get(key)
+    if template is not None:
+        return template
+
+    with _template_cache_lock:
+        template = _template_cache.get(key)
+        if template is None:
+            with Image.open(template_path) as img:
+                img.load()
+                if flatten:
+                    # Convert to RGB if needed (removes alpha channel)
+                    if img.mode == 'P':
+                        img = img.convert('RGBA')
+                    if img.mode in ('RGBA', 'LA'):
+                        template = Image.new('RGB', img.size, (255, 255, 255))
+                        template.paste(img, mask=img.split()[-1])
+                    else:
+                        template = img.convert('RGB')
+                else:
+                    template = img.copy()
+            if color_mode != 'rgb':
+                template = quantize_template(template, color_mode, colors, threshold)
+            _template_cache[key] = template
+    return template
+
+
+def load_font(font_path, font_size):
+    """Return (font, True) for the TrueType font, or (Pillow's default font, False)."""
+    try:
+        return ImageFont.truetype(font_path, font_size), True
+    except Exception:
+        return ImageFont.load_default(), False
+
+
+class PlanField(NamedTuple):
+    """One placed field of a render plan."""
+    field: str
+    index: int           # Position of the field's text in a card's texts
+    origin: tuple        # (x, y) as captured; the fraction is part of the rasterised glyphs
+    pixel: tuple         # (int(x), int(y)), where cached text bitmaps are pasted
+    font: object
+    fill: object         # Font colour resolved for the template's mode
+    cache_prefix: object # None: always rasterise, 0: cache the whole value, n: cache the first n characters
+
+
+class RenderPlan(NamedTuple):
+    """Compiled layout: the placed fields in draw order, for one template size and mode."""
+    fields: tuple
+    size: tuple
+    mode: str
+
+
+def compile_render_plan(config, coordinates, template, font):
+    """Compile config + coordinates into a RenderPlan for the template.
+
+    Raises ValueError if a field's origin lies outside the template.
+    """
+    width, height = template.size
+    if template.mode == 'P':
+        # Palette index of the font colour, added to the palette if quantising left it out
+        fill = template.palette.getcolor(ImageColor.getrgb(config['font']['color'])[:3], template)
+    elif template.mode == '1':
+        threshold = config.get('optimization', {}).get('threshold', 128)
+        fill = 255 if ImageColor.getcolor(config['font']['color'], 'L') >= threshold else 0
+    else:
+        fill = ImageColor.getcolor(config['font']['color'], template.mode)
+    text_cache = config.get('text_cache', {})
+    cached_fields = set(text_cache.get('fields', ['gender', 'semester', 'course']))
+    prefix_fields = text_cache.get('prefix_fields', {})
+
+    fields = []
+    outside = []
+    for index, field in enumerate(config['fields']):
+        if field not in coordinates:
+            continue
+        x, y = coordinates[field]
+        if not (0 <= x < width and 0 <= y < height):
+            outside.append(f"{field} ({x:.0f}, {y:.0f})")
+            continue
+        if not text_cache.get('enabled', True):
+            cache_prefix = None
+        elif field in cached_fields:
+            cache_prefix = 0
+        elif template.mode in ('1', 'P'):
+            # 1-bit text: the suffix cannot be placed from the prefix's advance (hinted per string)
+            cache_prefix = None
+        else:
+            cache_prefix = prefix_fields.get(field)
+        fields.append(PlanField(field, index, (x, y), (int(x), int(y)), font, fill, cache_prefix))
+    if outside:
+        raise ValueError(f"Coordinates outside the {width}x{height}px template: {', '.join(outside)}")
+    return RenderPlan(tuple(fields), (width, height), template.mode)
+
+
+def render_text_mask(xy, value, font, mode='L'):
+    """Rasterise value as an alpha mask ('L'), or a 1-bit mask ('1') for palette and bilevel cards.
+
+    Returns (mask, (x, y)) such that pasting the fill colour through mask at
+    (x, y) gives the same pixels as draw.text(xy, value, font=font).
+    """
+    x, y = xy
+    # The sub-pixel part of the origin changes the rasterised glyphs, keep it
+    frac_x, frac_y = math.modf(x)[0], math.modf(y)[0]
+    left, top, right, bottom = font.getbbox(value)
+    pad_x = 2 + max(0, -int(left))
+    pad_y = 2 + max(0, -int(top))
+    mask = Image.new(mode, (pad_x + int(right) + 3, pad_y + int(bottom) + 3), 0)
+    ImageDraw.Draw(mask).text((pad_x + frac_x, pad_y + frac_y), value, font=font, fill=255)
+    box = mask.getbbox()
+    if box is None:
+        return None, (int(x), int(y))
+    return mask.crop(box), (int(x) - pad_x + box[0], int(y) - pad_y + box[1])
+
+
+class TextBitmapCache:
+    """Thread-safe LRU cache of rendered text masks.
+
+    Keys are (field, value, font, size, colour). The field is part of the key
+    because its coordinate fixes the sub-pixel origin the mask was rendered at.
+    """
+
+    def __init__(self, max_entries, mask_mode='L'):
+        self.max_entries = max_entries
+        self.mask_mode = mask_mode
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, field, xy, value, font, fill):
+        """Return (mask, offset) for value, rendering it on a miss.
+
+        The offset is relative to (int(x), int(y)), so a hit can be pasted at
+        any whole-pixel shift of the field's origin.
+        """
+        key = (field, value, getattr(font, 'path', None), getattr(font, 'size', None), fill)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        mask, offset = render_text_mask(xy, value, font, self.mask_mode)
+        entry = (mask, (offset[0] - int(xy[0]), offset[1] - int(xy[1])))
+        with self._lock:
+            self._entries[key] = entry
+            if len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def stats(self):
+        """Return (hits, misses)."""
+        return self.hits, self.misses
+
+
+class GlyphAtlas:
+    """Glyph masks of one font, rasterised once and blitted into strings with NumPy.
+
+    Reproduces Pillow's basic layout: glyph i starts at the sum of the
+    advances (with kerning) of the glyphs before it, in 26.6 fixed point,
+    and each glyph mask is composited over the earlier ones with Pillow's
+    rounding. Strings come out pixel-identical to draw.text() (see
+    tests/test_glyph_atlas.py).
+    """
+
+    def __init__(self, font):
+        self.font = font
+        self._glyphs = {}    # (char, x phase, y fraction) -> (array, offset)
+        self._advances = {}  # (char, next char) -> advance in 1/64 px
+        self._lock = threading.Lock()
+
+    def _advance(self, char, next_char):
+        key = (char, next_char)
+        advance = self._advances.get(key)
+        if advance is None:
+            # Advance of char plus its kerning against next_char
+            advance = round((self.font.getlength(char + next_char) - self.font.getlength(next_char)) * 64)
+            with self._lock:
+                self._advances[key] = advance
+        return advance
+
+    def _glyph(self, char, phase, frac_y):
+        import numpy as np
+        key = (char, phase, frac_y)
+        glyph = self._glyphs.get(key)
+        if glyph is None:
+            mask, offset = render_text_mask((phase / 64, frac_y), char, self.font)
+            glyph = (np.asarray(mask) if mask is not None else None, offset)
+            with self._lock:
+                self._glyphs[key] = glyph
+        return glyph
+
+    def render(self, xy, value):
+        """Return (mask, (x, y)) for value, like render_text_mask()."""
+        import numpy as np
+        x, y = xy
+        frac_x, frac_y = math.modf(x)[0], math.modf(y)[0]
+
+        # Place every glyph first to size the buffer
+        placed = []
+        pen = round(frac_x * 64)
+        for i, char in enumerate(value):
+            whole, phase = divmod(pen, 64)
+            array, (gx, gy) = self._glyph(char, phase, frac_y)
+            if array is not None:
+                placed.append((array, whole + gx, gy))
+            if i + 1 < len(value):
+                pen += self._advance(char, value[i + 1])
+        if not placed:
+            return None, (int(x), int(y))
+
+        left = min(px for _, px, _ in placed)
+        top = min(py for _, _, py in placed)
+        right = max(px + a.shape[1] for a, px, _ in placed)
+        bottom = max(py + a.shape[0] for a, _, py in placed)
+        buffer = np.zeros((bottom - top, right - left), dtype=np.uint32)
+        for array, px, py in placed:
+            region = buffer[py - top:py - top + array.shape[0], px - left:px - left + array.shape[1]]
+            # Later glyphs are composited over earlier ones like Pillow does:
+            # coverage + earlier * (255 - coverage) / 255, rounded as its MULDIV255
+            product = region * (255 - array) + 128
+            region[...] = array + (((product >> 8) + product) >> 8)
+        return Image.fromarray(buffer.astype(np.uint8), 'L'), (int(x) + left, int(y) + top)
+
+
+class IncrementalJpegEncoder:
+    """Baseline JPEG encoder that reuses the template's entropy-coded MCU rows.
+
+    The template is encoded once with a restart marker after every MCU row
+    (16 px at 4:2:0). Restart intervals reset DC prediction and start on a
+    byte boundary, so each row can be swapped independently. A card then
+    only encodes the rows its fields touch and splices them in between the
+    template's rows, giving the same bytes as encoding the whole card with
+    the same settings. Huffman tables are the standard ones (no optimize),
+    which is what makes the rows interchangeable. That costs size: on a
+    1920x1080 template at quality 85, encoding takes ~4 ms instead of ~12 ms
+    for a whole-card optimize=True save (~3x faster), and files are ~50%
+    larger (~90 KB instead of ~60 KB).
+    """
+
+    MCU_SIZE = 16
+
+    def __init__(self, template, quality):
+        if template.mode != 'RGB':
+            raise ValueError("Incremental encoding needs an RGB template")
+        self.template = template
+        self.quality = quality
+        self.header, self.rows = self._split(self._encode(template))
+        if len(self.rows) != math.ceil(template.size[1] / self.MCU_SIZE):
+            # Older Pillow versions ignore restart_marker_rows
+            raise ValueError("This Pillow version cannot write restart markers")
+
+    def _encode(self, img):
+        buffer = io.BytesIO()
+        img.save(buffer, 'JPEG', quality=self.quality, subsampling=2, restart_marker_rows=1)
+        return buffer.getvalue()
+
+    @staticmethod
+    def _split(data):
+        """Split a JPEG into (headers up to the scan, [entropy-coded restart intervals])."""
+        sos = data.index(b'\xff\xda')
+        scan_start = sos + 2 + int.from_bytes(data[sos + 2:sos + 4], 'big')
+        scan = data[scan_start:data.rindex(b'\xff\xd9')]
+        rows = []
+        start = pos = 0
+        while True:
+            pos = scan.find(b'\xff', pos)
+            if pos < 0:
+                break
+            if 0xd0 <= scan[pos + 1] <= 0xd7:  # RSTn marker
+                rows.append(scan[start:pos])
+                start = pos = pos + 2
+            else:  # Stuffed 0xFF00
+                pos += 2
+        rows.append(scan[start:])
+        return data[:scan_start], rows
+
+    def encode(self, tiles):
+        """Encode the template with tiles [(box, image)] pasted on it."""
+        width, height = self.template.size
+        mcu = self.MCU_SIZE
+        dirty = sorted({row for box, _ in tiles for row in range(box[1] // mcu, (box[3] - 1) // mcu + 1)})
+
+        # Stack the dirty MCU rows into one band image and draw the tiles on it
+        band_y = {}
+        band_height = 0
+        for row in dirty:
+            band_y[row] = band_height
+            band_height += min(mcu, height - row * mcu)
+        band = Image.new('RGB', (width, band_height))
+        for row in dirty:
+            band.paste(self.template.crop((0, row * mcu, width, min(height, (row + 1) * mcu))), (0, band_y[row]))
+        for box, tile in tiles:
+            first_row = box[1] // mcu
+            band.paste(tile, (box[0], band_y[first_row] + box[1] - first_row * mcu))
+
+        rows = list(self.rows)
+        for row, encoded in zip(dirty, self._split(self._encode(band))[1]):
+            rows[row] = encoded
+
+        output = bytearray(self.header)
+        for i, encoded in enumerate(rows):
+            output += encoded
+            if i + 1 < len(rows):
+                output += bytes((0xff, 0xd0 + i % 8))
+        output += b'\xff\xd9'
+        return bytes(output)
+
+
+def composite_tiles(template, tiles):
+    """Paste rendered tiles onto a copy of the shared template, at encode time."""
+    img = template.copy()
+    for box, tile in tiles:
+        img.paste(tile, box[:2])
+    return img
+
+
+class AdmitCardRenderer:
+    """Draws student texts onto the template and saves the cards.
+
+    Thread-safe: one renderer is shared by all threads of a process. Cards
+    are given as texts in config['fields'] order (see roster.prepare_cards).
+    """
+
+    def __init__(self, config, coordinates, template_path=None, font=None):
+        self.config = config
+        self.field_names = config['fields']
+        self.text_sizes = {k: tuple(v) for k, v in config.get('text_sizes', {}).items()}
+        self.template_path = template_path or config['paths']['template']
+        self.output_path = config['paths']['output']
+        self.output_layout = config.get('output', {}).get('layout', 'flat')  # "flat", "prefix" or "hash" (see manifest.py)
+        if self.output_layout not in OUTPUT_LAYOUTS:
+            raise ValueError(f"Unknown output layout {self.output_layout!r} (expected one of {', '.join(OUTPUT_LAYOUTS)})")
+
+        self.font_path = config['font']['path']
+        self.font_size = config['font']['size']
+        self.font_engine = config['font'].get('engine', 'pillow')  # "pillow" or "atlas" (glyph atlas + NumPy)
+        self.render_mode = config['performance'].get('render_mode', 'full')  # "full" or "dirty_rect"
+
+        optimization = config.get('optimization', {})
+        self.optimize_images = optimization.get('enabled', True)
+        self.image_quality = optimization.get('quality', 85)
+        self.compress_level = optimization.get('compress_level', 6)
+        self.jpeg_encoder = optimization.get('encoder', 'pillow')  # "pillow" or "incremental"
+        self.color_mode = optimization.get('color_mode', 'rgb')  # "rgb", "palette" or "bilevel"
+        if self.color_mode not in COLOR_MODES:
+            raise ValueError(f"Unknown color mode {self.color_mode!r} (expected one of {', '.join(COLOR_MODES)})")
+        self.extension = output_extension(config)
+        self.mime_type = MIME_TYPES[self.extension]
+        # Palette and bilevel cards get text without anti-aliasing, like draw.text() on such images
+        self.text_mask_mode = 'L' if self.color_mode == 'rgb' else '1'
+        if self.color_mode != 'rgb':
+            # Hinting moves 1-bit glyphs by whole pixels within a string, the atlas cannot place them
+            self.font_engine = 'pillow'
+
+        text_cache = config.get('text_cache', {})
+        self.text_cache = (TextBitmapCache(text_cache.get('max_entries', 1024), self.text_mask_mode)
+                           if text_cache.get('enabled', True) else None)
+
+        if font is None:
+            font, self.font_loaded = load_font(self.font_path, self.font_size)
+        else:
+            self.font_loaded = True
+        self.font = font
+        self.template = load_template(self.template_path, self.optimize_images or self.color_mode != 'rgb', self.color_mode,
+                                      optimization.get('palette_colors', 16), optimization.get('threshold', 128))
+        self.plan = compile_render_plan(config, coordinates, self.template, font)
+
+        self._atlas = None
+        self._dirty_rects = None
+        self._incremental_encoder = None
+        self._encoder_lock = threading.Lock()
+
+    @classmethod
+    def from_files(cls, config_path, coordinates_path=None):
+        """Build a renderer from a config file and its coordinates file."""
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+        with open(coordinates_path or config['paths']['coordinates'], 'r') as f:
+            coordinates = json.load(f)
+        return cls(config, coordinates)
+
+    @property
+    def glyph_atlas(self):
+        if self._atlas is None:
+            self._atlas = GlyphAtlas(self.font)
+        return self._atlas
+
+    def draw_text(self, img, draw, xy, value, entry):
+        """Rasterise a unique value with the configured text engine."""
+        if self.font_engine == 'atlas' and isinstance(entry.font, ImageFont.FreeTypeFont):
+            mask, offset = self.glyph_atlas.render(xy, value)
+            if mask is not None:
+                img.paste(entry.fill, offset, mask)
+        else:
+            draw.text(xy, value, font=entry.font, fill=entry.fill)
+
+    def draw_field(self, img, draw, entry, value, shift=(0, 0)):
+        """Draw one plan field, pasting cached bitmaps for repeating values.
+
+        shift is the top-left corner of img on the card (for tiles).
+        """
+        x, y = entry.origin[0] - shift[0], entry.origin[1] - shift[1]
+        cache_prefix = entry.cache_prefix
+        if cache_prefix is None or (cache_prefix and len(value) <= cache_prefix):
+            self.draw_text(img, draw, (x, y), value, entry)
+            return
+
+        # Cached whole value, or cached prefix (e.g. "CS2021") with the unique suffix rasterised fresh
+        prefix = value[:cache_prefix] if cache_prefix else value
+        mask, offset = self.text_cache.get(entry.field, (x, y), prefix, entry.font, entry.fill)
+        if mask is not None:
+            img.paste(entry.fill, (entry.pixel[0] - shift[0] + offset[0], entry.pixel[1] - shift[1] + offset[1]), mask)
+        if cache_prefix:
+            suffix = value[cache_prefix:]
+            # Advance of the prefix including kerning against the first suffix character
+            advance = entry.font.getlength(prefix + suffix[0]) - entry.font.getlength(suffix[0])
+            self.draw_text(img, draw, (x + advance, y), suffix, entry)
+
+    def compare_text_engines(self, cards):
+        """Render cards with the glyph atlas and with ImageDraw.text; return the largest pixel difference."""
+        worst = 0
+        for card in cards:
+            for entry in self.plan.fields:
+                value = card.texts[entry.index]
+                reference_mask, reference_offset = render_text_mask(entry.origin, value, entry.font, self.text_mask_mode)
+                atlas_mask, atlas_offset = self.glyph_atlas.render(entry.origin, value)
+                if reference_mask is None or atlas_mask is None:
+                    if reference_mask is not atlas_mask:
+                        worst = 255
+                    continue
+                # Compare both masks on a common canvas
+                left = min(reference_offset[0], atlas_offset[0])
+                top = min(reference_offset[1], atlas_offset[1])
+                width = max(reference_offset[0] + reference_mask.size[0], atlas_offset[0] + atlas_mask.size[0]) - left
+                height = max(reference_offset[1] + reference_mask.size[1], atlas_offset[1] + atlas_mask.size[1]) - top
+                expected = Image.new('L', (width, height), 0)
+                expected.paste(reference_mask, (reference_offset[0] - left, reference_offset[1] - top))
+                actual = Image.new('L', (width, height), 0)
+                actual.paste(atlas_mask, (atlas_offset[0] - left, atlas_offset[1] - top))
+                worst = max(worst, ImageChops.difference(expected, actual).getextrema()[1])
+        return worst
+
+    def compute_dirty_rects(self):
+        """Merge the plan's field boxes (origin + text_sizes) into tiles.
+
+        Returns a list of ((left, top, right, bottom), [plan fields]) clipped to
+        the template size. Overlapping boxes are unioned into one tile.
+        """
+        width, height = self.plan.size
+        tiles = []
+        for entry in self.plan.fields:
+            x, y = entry.origin
+            # Fields without a text_sizes entry get a strip to the right edge
+            w, h = self.text_sizes.get(entry.field, (width - x, self.font_size * 2))
+            box = [max(0, int(x) - DIRTY_RECT_PADDING), max(0, int(y) - DIRTY_RECT_PADDING),
+                   min(width, math.ceil(x + w) + DIRTY_RECT_PADDING), min(height, math.ceil(y + h) + DIRTY_RECT_PADDING)]
+            fields = [entry]
+
+            # Absorb every tile this box overlaps, until none is left
+            merged = True
+            while merged:
+                merged = False
+                for other in tiles:
+                    other_box, other_fields = other
+                    if box[0] < other_box[2] and other_box[0] < box[2] and box[1] < other_box[3] and other_box[1] < box[3]:
+                        box = [min(box[0], other_box[0]), min(box[1], other_box[1]),
+                               max(box[2], other_box[2]), max(box[3], other_box[3])]
+                        fields = other_fields + fields
+                        tiles.remove(other)
+                        merged = True
+                        break
+            tiles.append((box, fields))
+        return [(tuple(box), fields) for box, fields in tiles]
+
+    @property
+    def dirty_rects(self):
+        """Dirty-rectangle tiles for the template (computed once)."""
+        if self._dirty_rects is None:
+            self._dirty_rects = self.compute_dirty_rects()
+        return self._dirty_rects
+
+    def render_dirty_tiles(self, texts):
+        """Draw the fields into copies of their tiles only.
+
+        Returns [(box, tile)], or None if a value's ink leaves its tile on any
+        side (long values, tall glyphs, descenders, negative left bearings),
+        in which case the card has to be drawn on the full canvas.
+        """
+        tiles = []
+        for box, entries in self.dirty_rects:
+            for entry in entries:
+                x, y = entry.origin
+                left, top, right, bottom = entry.font.getbbox(texts[entry.index], self.text_mask_mode)
+                # Rounded outwards, as fractional origins can shift the ink by a pixel
+                if (math.floor(x + left) < box[0] or math.floor(y + top) < box[1]
+                        or math.ceil(x + right) > box[2] or math.ceil(y + bottom) > box[3]):
+                    return None
+
+            tile = self.template.crop(box)
+            draw = ImageDraw.Draw(tile)
+            for entry in entries:
+                self.draw_field(tile, draw, entry, texts[entry.index], box[:2])
+            tiles.append((box, tile))
+        return tiles
+
+    def render(self, texts):
+        """Execute the render plan for the student's texts and return the card image."""
+        if self.render_mode == 'dirty_rect':
+            tiles = self.render_dirty_tiles(texts)
+            if tiles is not None:
+                return composite_tiles(self.template, tiles)
+
+        # Copy of the decoded template (thread-safe, decoded once per process)
+        img = self.template.copy()
+        draw = ImageDraw.Draw(img)
+        for entry in self.plan.fields:
+            self.draw_field(img, draw, entry, texts[entry.index])
+        return img
+
+    def incremental_encoder(self):
+        """Return the incremental JPEG encoder for the template, or None when unsupported."""
+        if self._incremental_encoder is None:
+            with self._encoder_lock:
+                if self._incremental_encoder is None:
+                    try:
+                        self._incremental_encoder = IncrementalJpegEncoder(self.template, self.image_quality)
+                    except Exception as e:
+                        print(f"⚠ Incremental JPEG encoding unavailable ({e}), using full encoding")
+                        self._incremental_encoder = False
+        return self._incremental_encoder or None
+
+    def render_jpeg(self, texts):
+        """Render a card straight to JPEG bytes with the incremental encoder.
+
+        Returns None when the card has to go through the full render and save
+        path (encoder unavailable, or a value overflows its tile).
+        """
+        encoder = self.incremental_encoder()
+        if encoder is None:
+            return None
+        tiles = self.render_dirty_tiles(texts)
+        if tiles is None:
+            return None
+        return encoder.encode(tiles)
+
+    def encode_image(self, img, fp):
+        """Save a rendered card to a path or file object in the output format."""
+        if self.extension == 'tif':
+            # One strip, so the PDF writer can embed the Group 4 data as it is
+            img.save(fp, 'TIFF', compression='group4', tiffinfo={TiffImagePlugin.ROWSPERSTRIP: img.size[1]})
+        elif self.extension == 'jpg':
+            # Template is already flattened to RGB by load_template()
+            img.save(fp, 'JPEG', quality=self.image_quality, optimize=True)
+        elif self.color_mode == 'palette':
+            # The quantised palette is already minimal; optimize would triple the encode time
+            img.save(fp, 'PNG', compress_level=self.compress_level)
+        else:
+            img.save(fp, 'PNG', compress_level=self.compress_level, optimize=True)
+
+    def render_bytes(self, texts):
+        """Render a card and return the encoded file contents, without touching the disk."""
+        if self.extension == 'jpg' and self.jpeg_encoder == 'incremental':
+            jpeg_bytes = self.render_jpeg(texts)
+            if jpeg_bytes is not None:
+                return jpeg_bytes
+        img = self.render(texts)
+        buffer = io.BytesIO()
+        self.encode_image(img, buffer)
+        return buffer.getvalue()
+
+    def encode(self, card):
+        """Render one card (a roster.CardRecord) to bytes. Returns (success, name, error, data)."""
+        try:
+            return (True, card.name, None, self.render_bytes(card.texts))
+        except Exception as e:
+            return (False, card.name, str(e), None)
+
+    def output_file(self, safe_filename, output_dir=None):
+        """Absolute path of a student's card (.jpg when optimizing, .png otherwise, .tif when bilevel)."""
+        return os.path.abspath(os.path.join(output_dir or self.output_path,
+                                            card_path(safe_filename, self.extension, self.output_layout)))
+
+    def save(self, card, output_dir=None):
+        """Render and save one card (a roster.CardRecord). Returns (success, name, error, size in bytes).
+
+        output_dir defaults to the configured output folder.
+        """
+        name, safe_filename, texts = card.name, card.filename, card.texts
+        try:
+            # Filename was sanitized by prepare_cards()
+            output_file = self.output_file(safe_filename, output_dir)
+
+            # Verify output path is within allowed directory (prevent path traversal)
+            output_dir = os.path.abspath(output_dir or self.output_path)
+            if not output_file.startswith(output_dir):
+                return (False, name, "Path traversal attempt detected", None)
+            if self.output_layout != 'flat':
+                os.makedirs(os.path.dirname(output_file), exist_ok=True)
+
+            # Encode in memory, then write to a temp file renamed into place once complete
+            data = self.render_bytes(texts)
+            def write(path):
+                with open(path, 'wb') as f:
+                    f.write(data)
+            replace_atomic(output_file, write, sync=False)
+
+            return (True, name, None, len(data))
+        except Exception as e:
+            return (False, name, str(e), None)
+
+    def cache_stats(self):
+        """Return the text cache's (hits, misses)."""
+        return self.text_cache.stats() if self.text_cache is not None else (0, 0)
+
+
+# Per-process renderer for the "process" backend, set once by the pool initializer
+_worker_renderer = None
+
+def init_process_worker(config, coordinates):
+    """Pool initializer: load font, coordinates and decoded template once per worker."""
+    global _worker_renderer
+    _worker_renderer = AdmitCardRenderer(config, coordinates)
+
+def warm_up_worker(delay=0.0):
+    """Build the lazily computed render state of a worker process; returns its pid.
+
+    The delay keeps one worker busy so the next warm-up lands on another.
+    """
+    if _worker_renderer.render_mode == 'dirty_rect':
+        _worker_renderer.dirty_rects
+        if _worker_renderer.extension == 'jpg' and _worker_renderer.jpeg_encoder == 'incremental':
+            _worker_renderer.incremental_encoder()
+    if _worker_renderer.font_engine == 'atlas' and isinstance(_worker_renderer.font, ImageFont.FreeTypeFont):
+        _worker_renderer.glyph_atlas
+    time.sleep(delay)
+    return os.getpid()
+
+def render_chunk(cards, output_dir=None):
+    """Render a chunk of cards inside a worker process.
+
+    Returns (results, worker pid, text cache stats) so the parent can total
+    the per-worker cache counters.
+    """
+    results = [_worker_renderer.save(card, output_dir) for card in cards]
+    return results, os.getpid(), _worker_renderer.cache_stats()
+
+def encode_chunk(cards):
+    """Like render_chunk(), but return each card's encoded bytes instead of saving it."""
+    results = [_worker_renderer.encode(card) for card in cards]
+    return results, os.getpid(), _worker_renderer.cache_stats()
@@ -0,0 +1,479 @@
+"""
+Roster - Columnar pre-formatting of student rows into render-ready cards
+
+Everything a card needs (the text of every field and its output filename)
+is computed per CSV chunk with vectorised column operations, before any
+rendering starts. Renderers then receive CardRecord tuples of final strings,
+zipped straight from the column arrays (no pd.Series per row).
+
+RosterValidator checks the whole roster the same way, chunk by chunk, and
+reports the row numbers that break each rule.
+
+RosterIndex keeps a sidecar file next to the CSV mapping roll and
+registration numbers to the byte offset of their row, sorted so one
+student is found by binary search and read with a seek instead of
+parsing the whole roster.
+
+Run as a script to compare the per-row cost against DataFrame.iterrows():
+    python roster.py students.csv
+
+TIME COMPLEXITY ANALYSIS:
+- prepare_cards(): O(r * f) vectorised - r = rows in the chunk, f = fields
+- RosterValidator: O(n * f) vectorised, plus O(n) hashing for duplicates
+- RosterIndex: O(s + n log n) build (s = file size), O(log n) lookup
+  (binary search with seeks + one row)
+
+SPACE COMPLEXITY ANALYSIS:
+- One chunk of formatted strings at a time: O(r * f)
+- RosterValidator: O(n) - roll numbers and filenames of every row
+- RosterIndex: O(n) while building, 20 bytes per indexed key on disk;
+  O(1) per lookup
+"""
+
+import csv
+import hashlib
+import io
+import os
+import re
+import struct
+import sys
+import time
+from typing import NamedTuple
+import numpy as np
+import pandas as pd
+from manifest import replace_atomic
+
+# Characters allowed in output filenames: alphanumeric, spaces, hyphens, underscores, dots
+FILENAME_PATTERN = re.compile(r'[^a-zA-Z0-9\s\-_.]')
+# Names that sanitize_filename() returns unchanged (separators are not in the allowed set)
+CLEAN_FILENAME_PATTERN = re.compile(r'(?![. ])[a-zA-Z0-9\s\-_.]{1,200}(?<![. ])')
+# Everything up to the last path separator (what os.path.basename removes)
+PATH_PREFIX_PATTERN = '^.*[' + re.escape(os.sep + (os.altsep or '')) + ']'
+MAX_FILENAME_LENGTH = 200
+INDEX_VERSION = 2
+INDEX_COLUMNS = ('roll no.', 'reg no.')  # Columns a student can be looked up by
+INDEX_MAGIC = b'RIDX'
+# Sidecar header: magic, version, CSV size, CSV mtime (ns), hash of the indexed columns, record count
+INDEX_HEADER = struct.Struct('<4sIQqQI')
+# Sidecar record: hash of column and value, byte offset of the row, row number
+INDEX_RECORD = struct.Struct('<QQI')
+INDEX_RECORD_DTYPE = np.dtype([('key', '<u8'), ('offset', '<u8'), ('row', '<u4')])
+
+
+class CardRecord(NamedTuple):
+    """One render-ready student card."""
+    row: int        # CSV row number, orders PDF pages
+    name: str
+    filename: str   # Sanitized, without extension
+    texts: tuple    # Text of each configured field, in field order
+
+
+class RowFailure(NamedTuple):
+    """A student row that cannot be drawn."""
+    row: int
+    name: str
+    error: str
+
+
+def to_roman(num):
+    """Convert number to Roman numeral."""
+    val = [10, 9, 5, 4, 1]
+    syms = ['X', 'IX', 'V', 'IV', 'I']
+    roman = ''
+    i = 0
+    num = int(float(num))  # CSV values arrive as strings such as "3" or "3.0"
+    while num > 0:
+        for _ in range(num // val[i]):
+            roman += syms[i]
+            num -= val[i]
+        i += 1
+    return roman
+
+# Semester lookup table for the values a roster actually contains
+ROMAN_NUMERALS = {}
+for _n in range(1, 13):
+    ROMAN_NUMERALS[str(_n)] = ROMAN_NUMERALS[f"{_n}.0"] = to_roman(_n)
+
+
+def sanitize_filename(filename):
+    """Sanitize filename to prevent path traversal and remove special characters."""
+    # Remove path separators and special characters
+    filename = str(filename)
+    # Remove any path components
+    filename = os.path.basename(filename)
+    # Remove special characters, keep only alphanumeric, spaces, hyphens, underscores
+    filename = FILENAME_PATTERN.sub('_', filename)
+    # Remove leading/trailing spaces and dots
+    filename = filename.strip('. ')
+    # Limit length
+    if len(filename) > MAX_FILENAME_LENGTH:
+        filename = filename[:MAX_FILENAME_LENGTH]
+    # Ensure not empty
+    if not filename:
+        filename = 'unnamed'
+    return filename
+
+
+def sanitize_filenames(values):
+    """Vectorised sanitize_filename() over a Series."""
+    names = values.astype(str)
+    # Roll numbers are almost always clean already; rewrite only the others
+    dirty = ~names.str.fullmatch(CLEAN_FILENAME_PATTERN)
+    if not dirty.any():
+        return names
+    fixed = names[dirty].str.replace(PATH_PREFIX_PATTERN, '', regex=True)
+    fixed = fixed.str.replace(FILENAME_PATTERN, '_', regex=True)
+    fixed = fixed.str.strip('. ').str.slice(0, MAX_FILENAME_LENGTH)
+    names[dirty] = fixed.mask(fixed == '', 'unnamed')
+    return names
+
+
+def format_semesters(values):
+    """Vectorised to_roman() over a Series of strings.
+
+    Returns (numerals, errors): errors maps a row label to the message for
+    values that are not numbers.
+    """
+    numerals = values.map(ROMAN_NUMERALS)
+    errors = {}
+    unknown = numerals.isna() & values.notna()
+    if unknown.any():
+        # Values outside the table, e.g. "13" or "III": convert each distinct value once
+        converted = {}
+        for value in values[unknown].unique():
+            try:
+                converted[value] = to_roman(value)
+            except (ValueError, TypeError) as e:
+                converted[value] = None
+                errors[value] = str(e)
+        numerals[unknown] = values[unknown].map(converted)
+        errors = {label: errors[value] for label, value in values[unknown].items() if value in errors}
+    return numerals, errors
+
+
+# Column formatters by name (config 'formats': field -> name); other fields are drawn as str()
+FORMATTERS = {'roman': format_semesters}
+DEFAULT_FORMATS = {'semester': 'roman'}
+
+
+def prepare_cards(chunk, fields, formats=None):
+    """Turn a CSV chunk into render-ready cards.
+
+    Returns (cards, failures): lists of CardRecord and RowFailure, in row order.
+    Texts follow the order of fields; formats maps a field to a FORMATTERS
+    name (by default 'semester' is converted to Roman numerals).
+    """
+    formats = DEFAULT_FORMATS if formats is None else formats
+    names = chunk['name'].fillna('Unknown').astype(str) if 'name' in chunk else pd.Series('Unknown', index=chunk.index)
+    missing = chunk[fields].isna()
+    has_missing = missing.any(axis=1)
+
+    errors = {}
+    if has_missing.any():
+        first_missing = missing[has_missing].idxmax(axis=1)
+        errors.update({label: f"Missing field: {field}" for label, field in first_missing.items()})
+
+    columns = []
+    for field in fields:
+        if field in formats:
+            formatted, format_errors = FORMATTERS[formats[field]](chunk[field])
+            for label, message in format_errors.items():
+                errors.setdefault(label, message)
+            columns.append(formatted.to_numpy(dtype=object))
+        else:
+            columns.append(chunk[field].astype(str).to_numpy(dtype=object))
+    rows = chunk.index.to_numpy()
+    names = names.to_numpy(dtype=object)
+    filenames = sanitize_filenames(chunk['roll no.']).to_numpy(dtype=object)
+
+    failures = []
+    if errors:
+        failed = chunk.index.isin(list(errors))
+        failures = [RowFailure(row, name, errors[row]) for row, name in zip(rows[failed].tolist(), names[failed])]
+        keep = ~failed
+        rows, names, filenames = rows[keep], names[keep], filenames[keep]
+        columns = [column[keep] for column in columns]
+
+    cards = list(map(CardRecord._make, zip(rows.tolist(), names, filenames, zip(*columns))))
+    return cards, failures
+
+
+class RosterValidator:
+    """Whole-roster validation with vectorised masks.
+
+    Feed CSV chunks (read with dtype=str) to add(), then call report().
+    Row numbers in the report are 0-based data rows, as in CardRecord.row.
+    """
+
+    RULES = {
+        'missing_values': "Missing values",
+        'duplicate_roll_no': "Duplicate roll numbers (cards overwrite each other)",
+        'semester_range': "Semester not a whole number in range",
+        'dob_format': "Date of birth not in the expected format",
+        'apaar_length': "APAAR ID of the wrong length",
+        'filename_collision': "Different roll numbers with the same output filename",
+    }
+
+    def __init__(self, fields, semester_range=(1, 10), dob_format='%d/%m/%Y', apaar_length=12):
+        self.fields = fields
+        self.semester_range = tuple(semester_range)
+        self.dob_format = dob_format
+        self.apaar_length = apaar_length
+        self._semester_values = [spelling for n in range(self.semester_range[0], self.semester_range[1] + 1)
+                                 for spelling in (str(n), f"{n}.0")]
+        self.rows = 0
+        self._issues = {rule: [] for rule in self.RULES}
+        self._roll_numbers = []
+        self._filenames = []
+
+    def _flag(self, rule, mask):
+        if mask.any():
+            self._issues[rule].append(mask.index[mask.to_numpy()].to_numpy())
+
+    def add(self, chunk):
+        """Check one chunk; duplicates are resolved across chunks in report()."""
+        self.rows += len(chunk)
+        self._flag('missing_values', chunk[self.fields].isna().any(axis=1))
+
+        if 'semester' in self.fields:
+            values = chunk['semester']
+            low, high = self.semester_range
+            # Table lookup first, numeric parsing only for the odd spellings left over
+            unknown = ~values.isin(self._semester_values) & values.notna()
+            if unknown.any():
+                numbers = pd.to_numeric(values[unknown], errors='coerce')
+                self._flag('semester_range', ~(numbers.between(low, high) & (numbers % 1 == 0)))
+        if 'dob' in self.fields:
+            values = chunk['dob']
+            dates = pd.to_datetime(values, format=self.dob_format, errors='coerce')
+            self._flag('dob_format', values.notna() & dates.isna())
+        if 'APAAR' in self.fields:
+            values = chunk['APAAR']
+            valid = values.str.fullmatch(rf'\d{{{self.apaar_length}}}').fillna(False).astype(bool)
+            self._flag('apaar_length', values.notna() & ~valid)
+
+        roll_numbers = chunk['roll no.'].dropna()
+        self._roll_numbers.append(roll_numbers)
+        self._filenames.append(sanitize_filenames(roll_numbers))
+
+    def report(self):
+        """Return {'rows', 'invalid_rows', 'issues': {rule: [row numbers]}}."""
+        issues = dict(self._issues)
+        if self._roll_numbers:
+            roll_numbers = pd.concat(self._roll_numbers)
+            filenames = pd.concat(self._filenames)
+            duplicated = roll_numbers.duplicated(keep=False)
+            if duplicated.any():
+                issues['duplicate_roll_no'] = [roll_numbers.index[duplicated.to_numpy()].to_numpy()]
+            # Rows whose filename is shared with a different roll number
+            shared = filenames.duplicated(keep=False)
+            if shared.any():
+                distinct = roll_numbers[shared].groupby(filenames[shared]).transform('nunique')
+                issues['filename_collision'] = [distinct.index[(distinct > 1).to_numpy()].to_numpy()]
+
+        issues = {rule: np.sort(np.concatenate(parts)).tolist() if parts else []
+                  for rule, parts in issues.items()}
+        invalid = set()
+        for rows in issues.values():
+            invalid.update(rows)
+        return {'rows': self.rows, 'invalid_rows': len(invalid), 'issues': issues}
+
+
+class RosterIndex:
+    """Sidecar index of a roster CSV: key value -> row number and byte offset.
+
+    Saved as <csv>.idx: a fixed-size header (CSV size and modification time,
+    indexed columns) followed by fixed-width records (hash of column and
+    value, byte offset, row number) sorted by hash. A lookup binary-searches
+    the records with seeks, so it costs O(log n) small reads however large
+    the roster is, and then checks the row it found really holds the value
+    (two keys can share a hash). Nothing is read until the first lookup;
+    the sidecar is rebuilt in one streaming pass whenever the CSV's size or
+    modification time no longer match. Rows are numbered like pandas numbers
+    them (blank lines skipped), so lookups agree with CardRecord.row.
+    """
+
+    def __init__(self, csv_path, columns=INDEX_COLUMNS, index_path=None):
+        self.csv_path = csv_path
+        self.columns = list(columns)
+        self.index_path = index_path or csv_path + '.idx'
+        self.rows = None
+        self.rebuilt = False
+        self._records = None   # Kept in memory only when the sidecar cannot be saved
+        self._columns_digest = self._hash('\x1f'.join(self.columns))
+
+    @staticmethod
+    def _hash(text):
+        return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+    def _header(self, stat, count):
+        return INDEX_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, stat.st_size, stat.st_mtime_ns,
+                                 self._columns_digest, count)
+
+    def _is_current(self, header):
+        """True if a sidecar header still matches the CSV and the indexed columns."""
+        if len(header) != INDEX_HEADER.size:
+            return False
+        return header == self._header(os.stat(self.csv_path), INDEX_HEADER.unpack(header)[-1])
+
+    @staticmethod
+    def _read_record(f):
+        """Read one CSV record, following quoted fields over line breaks."""
+        record = f.readline()
+        while record.count(b'"') % 2:
+            line = f.readline()
+            if not line:
+                break
+            record += line
+        return record
+
+    @staticmethod
+    def _values(record):
+        if b'"' in record:
+            return next(csv.reader([record.decode('utf-8')]))
+        return record.rstrip(b'\r\n').decode('utf-8').split(',')
+
+    def build(self):
+        """Index the CSV in one pass and save the sidecar. Returns self."""
+        stat = os.stat(self.csv_path)
+        keys, offsets, rows = [], [], []
+        with open(self.csv_path, 'rb') as f:
+            header = self._read_record(f)
+            names = next(csv.reader([header.decode('utf-8-sig')]))
+            positions = [(column, names.index(column)) for column in self.columns if column in names]
+            offset = len(header)
+            row = 0
+            while True:
+                record = self._read_record(f)
+                if not record:
+                    break
+                start, offset = offset, offset + len(record)
+                if not record.strip():
+                    continue
+                values = self._values(record)
+                for column, position in positions:
+                    if position < len(values) and values[position]:
+                        keys.append(self._hash(f"{column}\x1f{values[position]}"))
+                        offsets.append(start)
+                        rows.append(row)
+                row += 1
+
+        records = np.empty(len(keys), dtype=INDEX_RECORD_DTYPE)
+        records['key'], records['offset'], records['row'] = keys, offsets, rows
+        # Equal hashes stay in row order, so the first row wins for duplicated keys
+        records = records[np.lexsort((records['row'], records['key']))]
+        self.rows, self.rebuilt = row, True
+
+        def write(path):
+            with open(path, 'wb') as f:
+                f.write(self._header(stat, len(records)))
+                f.write(records.tobytes())
+        try:
+            replace_atomic(self.index_path, write)
+            self._records = None
+        except OSError:
+            # Read-only roster folder: keep the index in memory
+            self._records = (self._header(stat, len(records)), records)
+        return self
+
+    def _search(self, key):
+        """[(row, offset)] of the records with this key hash, in row order; None if the sidecar is stale."""
+        if self._records is not None:
+            header, records = self._records
+            if not self._is_current(header):
+                return None
+            start, end = np.searchsorted(records['key'], key, 'left'), np.searchsorted(records['key'], key, 'right')
+            return [(int(row), int(offset)) for row, offset in zip(records['row'][start:end], records['offset'][start:end])]
+        try:
+            with open(self.index_path, 'rb') as f:
+                header = f.read(INDEX_HEADER.size)
+                if not self._is_current(header):
+                    return None
+                count = INDEX_HEADER.unpack(header)[-1]
+                # Lower bound of the key, one record read per step
+                low, high = 0, count
+                while low < high:
+                    middle = (low + high) // 2
+                    f.seek(INDEX_HEADER.size + middle * INDEX_RECORD.size)
+                    if INDEX_RECORD.unpack(f.read(INDEX_RECORD.size))[0] < key:
+                        low = middle + 1
+                    else:
+                        high = middle
+                matches = []
+                f.seek(INDEX_HEADER.size + low * INDEX_RECORD.size)
+                for _ in range(low, count):
+                    record_key, offset, row = INDEX_RECORD.unpack(f.read(INDEX_RECORD.size))
+                    if record_key != key:
+                        break
+                    matches.append((row, offset))
+                return matches
+        except FileNotFoundError:
+            return None
+
+    def lookup(self, value, column=None):
+        """Return the student's row as a one-row DataFrame of strings, or None.
+
+        Looks in one column, or in every indexed column in order.
+        """
+        for name in ([column] if column else self.columns):
+            key = self._hash(f"{name}\x1f{value}")
+            matches = self._search(key)
+            if matches is None:
+                matches = self.build()._search(key)
+            for row, offset in matches:
+                header, record = self._read(offset)
+                names = next(csv.reader([header.decode('utf-8-sig')]))
+                values = self._values(record)
+                # Another key with the same hash points elsewhere
+                if name in names and names.index(name) < len(values) and values[names.index(name)] == value:
+                    return self._frame(row, header, record)
+        return None
+
+    def _read(self, offset):
+        with open(self.csv_path, 'rb') as f:
+            header = self._read_record(f)
+            f.seek(offset)
+            return header, self._read_record(f)
+
+    @staticmethod
+    def _frame(row, header, record):
+        """Parse one record as a one-row DataFrame of strings.
+
+        The DataFrame index is the row number, as in a chunk of read_csv().
+        """
+        if not header.endswith(b'\n'):
+            header += b'\n'
+        chunk = pd.read_csv(io.BytesIO(header + record), dtype=str)
+        chunk.index = pd.RangeIndex(row, row + 1)
+        return chunk
+
+
+def benchmark(csv_path, rows=100000):
+    """Print the per-row cost of iterrows() + per-cell formatting against prepare_cards()."""
+    chunk = pd.read_csv(csv_path, dtype=str)
+    # Repeat a small roster up to the requested number of rows
+    chunk = pd.concat([chunk] * -(-rows // len(chunk)), ignore_index=True).iloc[:rows]
+    fields = list(chunk.columns)
+    rows = len(chunk)
+
+    start = time.perf_counter()
+    records = []
+    for _, row in chunk.iterrows():
+        texts = tuple(to_roman(row[field]) if field == 'semester' else str(row[field]) for field in fields)
+        records.append((texts, sanitize_filename(row['roll no.'])))
+    before = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cards, failures = prepare_cards(chunk, fields)
+    after = time.perf_counter() - start
+
+    print(f"{rows} rows ({len(failures)} failures)")
+    print(f"  iterrows:      {before * 1e6 / rows:8.2f} us/row")
+    print(f"  prepare_cards: {after * 1e6 / rows:8.2f} us/row ({before / after:.0f}x faster)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("Usage: python roster.py <students.csv> [rows]")
+        sys.exit(1)
+    benchmark(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 100000)
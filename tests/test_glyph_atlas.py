@@ -0,0 +1,80 @@
+"""Pixel-diff the glyph atlas text engine against ImageDraw.text()."""
+
+import os
+import random
+
+import pytest
+from PIL import Image, ImageChops, ImageFont
+
+pytest.importorskip('numpy')
+from renderer import GlyphAtlas, render_text_mask
+
+SIZES = [9, 14, 23, 35, 61, 80]
+# Kerning pairs, overlapping italics, descenders and digits as they appear on cards
+SAMPLES = ['WAVY', 'AVATAR', 'Ty', 'LT', 'Yo.', "f'j", 'gjpqy', 'VAW, WAV', 'CS2021001', 'REG2020045',
+           '15/03/2003', 'Computer Science', 'Priya Patel', 'III', 'A V', 'To', 'P.', 'ffi']
+ORIGINS = [(0, 0), (508.2, 492.3), (120.5, 33.75), (37.015625, 211.984375), (640.9, 88.1)]
+
+
+def _font_paths():
+    paths = []
+    try:
+        import matplotlib
+        folder = os.path.join(matplotlib.get_data_path(), 'fonts', 'ttf')
+        paths += [os.path.join(folder, name) for name in
+                  ('DejaVuSans.ttf', 'DejaVuSerif-Italic.ttf', 'DejaVuSansMono.ttf', 'STIXGeneral.ttf')]
+    except ImportError:
+        pass
+    paths += ['C:/Windows/Fonts/times.ttf', 'C:/Windows/Fonts/arial.ttf']
+    return [path for path in paths if os.path.exists(path)]
+
+
+FONTS = [None] + _font_paths()  # None: Pillow's bundled default font
+
+
+def load_font(path, size):
+    return ImageFont.load_default(size) if path is None else ImageFont.truetype(path, size)
+
+
+def max_difference(actual, expected):
+    """Largest pixel difference between two (mask, (x, y)) results on a common canvas."""
+    (mask_a, (xa, ya)), (mask_b, (xb, yb)) = actual, expected
+    if mask_a is None or mask_b is None:
+        return 0 if mask_a is mask_b else 255
+    left, top = min(xa, xb), min(ya, yb)
+    right = max(xa + mask_a.size[0], xb + mask_b.size[0])
+    bottom = max(ya + mask_a.size[1], yb + mask_b.size[1])
+    canvas_a = Image.new('L', (right - left, bottom - top), 0)
+    canvas_a.paste(mask_a, (xa - left, ya - top))
+    canvas_b = Image.new('L', (right - left, bottom - top), 0)
+    canvas_b.paste(mask_b, (xb - left, yb - top))
+    return ImageChops.difference(canvas_a, canvas_b).getextrema()[1]
+
+
+@pytest.mark.parametrize('size', SIZES)
+@pytest.mark.parametrize('path', FONTS, ids=lambda path: os.path.basename(path) if path else 'default')
+def test_samples_match_draw_text(path, size):
+    font = load_font(path, size)
+    atlas = GlyphAtlas(font)
+    for value in SAMPLES:
+        for xy in ORIGINS:
+            assert max_difference(atlas.render(xy, value), render_text_mask(xy, value, font)) == 0, (value, xy)
+
+
+@pytest.mark.parametrize('path', FONTS, ids=lambda path: os.path.basename(path) if path else 'default')
+def test_random_strings_match_draw_text(path):
+    rng = random.Random(2024)
+    alphabet = 'AVWYTLPFkoeaygjQ.,-/ 0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    for size in (23, 61):
+        font = load_font(path, size)
+        atlas = GlyphAtlas(font)
+        for _ in range(150):
+            value = ''.join(rng.choice(alphabet) for _ in range(rng.randint(1, 14)))
+            xy = (rng.uniform(0, 900), rng.uniform(0, 900))
+            assert max_difference(atlas.render(xy, value), render_text_mask(xy, value, font)) == 0, (value, xy)
+
+
+def test_blank_values_have_no_mask():
+    atlas = GlyphAtlas(load_font(None, 35))
+    assert atlas.render((10.5, 20.25), '') == (None, (10, 20))
+    assert atlas.render((10.5, 20.25), '   ') == (None, (10, 20))
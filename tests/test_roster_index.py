@@ -0,0 +1,95 @@
+"""RosterIndex lookups against rows read by pandas."""
+
+import os
+import time
+
+import pandas as pd
+import pytest
+
+import roster
+from roster import RosterIndex, INDEX_HEADER, INDEX_RECORD
+
+ROSTER = '''name,roll no.,reg no.,course
+Aarav Sharma,CS2021001,REG2021001,Computer Science
+"Patel, Priya",EC2022041,REG2022041,"Electronics
+and Communication"
+
+Rohan Gupta,ME2020012,REG2020012,Mechanical
+Duplicate Roll,CS2021001,REG2021999,Computer Science
+Blank Reg,IT2023007,,Information Technology
+'''
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / 'students.csv'
+    path.write_text(ROSTER, encoding='utf-8')
+    return str(path)
+
+
+def expected_row(csv_path, row):
+    return pd.read_csv(csv_path, dtype=str).iloc[[row]]
+
+
+@pytest.mark.parametrize('key, row', [('CS2021001', 0), ('REG2021001', 0), ('EC2022041', 1),
+                                      ('REG2020012', 2), ('REG2021999', 3), ('IT2023007', 4)])
+def test_lookup_matches_read_csv(csv_path, key, row):
+    chunk = RosterIndex(csv_path).lookup(key)
+    pd.testing.assert_frame_equal(chunk, expected_row(csv_path, row))
+
+
+def test_missing_and_column_lookups(csv_path):
+    index = RosterIndex(csv_path)
+    assert index.lookup('CS9999999') is None
+    assert index.lookup('') is None
+    assert index.lookup('REG2021001', column='roll no.') is None
+    assert index.lookup('REG2021001', column='reg no.').index[0] == 0
+
+
+def test_sidecar_is_sorted_fixed_width_and_lazy(csv_path):
+    index = RosterIndex(csv_path)
+    assert not os.path.exists(index.index_path)
+    index.lookup('CS2021001')
+    assert index.rebuilt and index.rows == 5
+    with open(index.index_path, 'rb') as f:
+        header = f.read(INDEX_HEADER.size)
+        body = f.read()
+    count = INDEX_HEADER.unpack(header)[-1]
+    assert count == 9 and len(body) == count * INDEX_RECORD.size
+    keys = [key for key, _, _ in INDEX_RECORD.iter_unpack(body)]
+    assert keys == sorted(keys)
+
+    # A second index opens the saved sidecar instead of rebuilding it
+    again = RosterIndex(csv_path)
+    assert again.lookup('ME2020012').index[0] == 2
+    assert not again.rebuilt
+
+
+def test_rebuilds_when_csv_changes(csv_path):
+    index = RosterIndex(csv_path)
+    assert index.lookup('CS2021050') is None
+    time.sleep(0.01)
+    with open(csv_path, 'a', encoding='utf-8') as f:
+        f.write('New Student,CS2021050,REG2021050,Computer Science\n')
+    index.rebuilt = False
+    assert index.lookup('CS2021050').index[0] == 5
+    assert index.rebuilt
+
+
+def test_hash_collisions_are_told_apart(csv_path, monkeypatch):
+    # Every key hashes alike, so each lookup has to check the rows it finds
+    monkeypatch.setattr(RosterIndex, '_hash', staticmethod(lambda text: 7 if '\x1f' in text else 0))
+    index = RosterIndex(csv_path)
+    assert index.lookup('ME2020012').index[0] == 2
+    assert index.lookup('REG2021999').index[0] == 3
+    assert index.lookup('XX0000000') is None
+
+
+def test_read_only_folder_keeps_index_in_memory(csv_path, monkeypatch):
+    def fail(path, write, sync=True):
+        raise PermissionError(path)
+    monkeypatch.setattr(roster, 'replace_atomic', fail)
+    index = RosterIndex(csv_path)
+    assert index.lookup('EC2022041').index[0] == 1
+    assert index.lookup('REG2021001').index[0] == 0
+    assert not os.path.exists(index.index_path)
@@ -0,0 +1,315 @@
+"""
+Upload Watcher - Delta rendering of rosters dropped into uploads/
+
+Rosters arrive as <batch>_YYYYMMDD_HHMMSS.csv (students_20251129_104218.csv
+is batch "students"). Each batch has its own output folder with a content
+manifest (roll number -> hash of the card's texts, see manifest.py). When
+a newer roster of the batch lands, only students that are new or whose
+row changed are rendered; cards of students no longer in the roster are
+moved to <batch>/retired/. A nightly correction of a few hundred rows
+therefore renders a few hundred cards, not the whole roster.
+
+New files are picked up through inotify on Linux when they are closed
+after writing or renamed into the folder, and by polling the folder
+elsewhere (a file is only read once its size and mtime have been stable
+for one poll). Writers that fill a file in several passes should write it
+under another name and rename it into place, as the render service does
+(uploads/<name>.csv.part -> uploads/<name>.csv). A roster that cannot be
+read is tried again with a growing delay, up to READ_ATTEMPTS times; only
+rosters read to the end are recorded as rendered.
+
+    python watch_uploads.py [uploads folder]
+
+TIME COMPLEXITY ANALYSIS:
+- Per roster: O(n) hashing + O(c) renders - n = rows, c = added or changed rows
+- Polling: O(f) per poll - f = files in the folder
+
+SPACE COMPLEXITY ANALYSIS:
+- O(n) - manifest entries of the batch, cards to render are batched
+"""
+
+import ctypes
+import ctypes.util
+import json
+import os
+import re
+import select
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import pandas as pd
+from roster import prepare_cards
+from manifest import OutputManifest, render_fingerprint, card_digest, card_path, list_output_files, card_temp_files, replace_atomic
+from renderer import init_process_worker, output_extension, render_chunk, warm_up_worker
+from render_service import load_service_config, CONFIG_FILE
+
+# <batch>_YYYYMMDD_HHMMSS[_n].csv; timestamps sort as text
+UPLOAD_PATTERN = re.compile(r'^(?P<batch>.+?)_(?P<stamp>\d{8}_\d{6}(?:_\d+)?)\.csv$')
+STATE_FILE = 'watch_state.json'  # Batch -> last roster rendered, in the output folder
+RETIRED_FOLDER = 'retired'
+READ_ATTEMPTS = 5  # Tries per roster that cannot be read, the delay doubling from poll_seconds
+
+IN_CLOSE_WRITE = 0x08
+IN_MOVED_TO = 0x80
+INOTIFY_EVENT = struct.Struct('iIII')  # wd, mask, cookie, name length
+
+
+class InotifyWatch:
+    """Files closed after writing, or moved into a folder (Linux inotify through ctypes)."""
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"Cannot watch {directory}")
+
+    def wait(self, timeout):
+        """Return the names of files completed within timeout seconds."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        data = os.read(self.fd, 64 * 1024)
+        names = []
+        position = 0
+        while position < len(data):
+            _, _, _, length = INOTIFY_EVENT.unpack_from(data, position)
+            position += INOTIFY_EVENT.size
+            names.append(os.fsdecode(data[position:position + length].rstrip(b'\0')))
+            position += length
+        return names
+
+
+class UploadWatcher:
+    """Render each batch's newest roster as a delta against the batch's previous one."""
+
+    def __init__(self, config_path=CONFIG_FILE, upload_dir=None):
+        self.config, self.coordinates = load_service_config(config_path)
+        watch = self.config.get('watch', {})
+        self.upload_dir = upload_dir or watch.get('directory', self.config.get('service', {}).get('upload_dir', 'uploads'))
+        self.poll_interval = watch.get('poll_seconds', 2.0)
+        self.use_inotify = watch.get('use_inotify', True)
+        self.retire_removed = watch.get('retire_removed', True)
+        self.output_root = self.config['paths']['output']
+        self.state_path = os.path.join(self.output_root, STATE_FILE)
+
+        performance = self.config['performance']
+        self.workers = performance['max_workers']
+        self.chunk_size = performance.get('chunk_size', 64)
+        self.csv_chunk_size = performance.get('csv_chunk_size', 10000)
+        self.max_in_flight = performance.get('max_in_flight', self.workers * 4)
+        self.fields = self.config['fields']
+        self.roll_index = self.fields.index('roll no.')
+        self.formats = self.config.get('formats', {'semester': 'roman'})
+        self.extension = output_extension(self.config)
+        self.output_layout = self.config.get('output', {}).get('layout', 'flat')
+        self.layout_id = render_fingerprint(self.config, self.coordinates)
+        self.state = {}
+        self.retries = {}  # Roster name -> (failed attempts, time of the next try)
+        self.pool = None
+
+    def load_state(self):
+        try:
+            with open(self.state_path, 'r') as f:
+                self.state = json.load(f)
+        except (OSError, ValueError):
+            self.state = {}
+
+    def save_state(self):
+        def write(path):
+            with open(path, 'w') as f:
+                json.dump(self.state, f, indent=2)
+        replace_atomic(self.state_path, write)
+
+    def pending_rosters(self, names):
+        """Newest unrendered roster of each batch among names, oldest batch first."""
+        newest = {}
+        now = time.time()
+        for name in names:
+            match = UPLOAD_PATTERN.match(name)
+            if not match:
+                continue
+            attempts, retry_at = self.retries.get(name, (0, 0))
+            if attempts >= READ_ATTEMPTS or retry_at > now:
+                continue
+            batch = match.group('batch')
+            rendered = self.state.get(batch)
+            # Only the newest roster matters: it supersedes every earlier upload of the batch
+            if (rendered is None or name > rendered) and name > newest.get(batch, ''):
+                newest[batch] = name
+        return sorted(newest.items(), key=lambda item: item[1])
+
+    def due_retries(self):
+        """Rosters whose next try is due (inotify reports a file only once)."""
+        now = time.time()
+        return [name for name, (attempts, retry_at) in self.retries.items()
+                if attempts < READ_ATTEMPTS and retry_at <= now]
+
+    def render_roster(self, batch, name):
+        """Render the added and changed students of a roster; retire removed ones."""
+        start_time = time.time()
+        roster_path = os.path.join(self.upload_dir, name)
+        output_dir = os.path.join(self.output_root, batch)
+        os.makedirs(output_dir, exist_ok=True)
+        manifest = OutputManifest(os.path.join(output_dir, 'manifest.json'), self.layout_id)
+        manifest.load()
+        existing_files = list_output_files(output_dir, self.output_layout)
+        for leftover in card_temp_files(existing_files, self.extension, self.output_layout):
+            os.remove(os.path.join(output_dir, leftover))
+
+        seen = set()
+        rendered_keys = set()  # Roll numbers of the good rows, to catch repeats
+        digests = {}           # card row -> (roll number, digest) for cards being rendered
+        counts = {'added': 0, 'changed': 0, 'unchanged': 0, 'failed': 0, 'retired': 0}
+        errors = []
+
+        def changed_cards():
+            batch_cards = []
+            for chunk in pd.read_csv(roster_path, dtype={field: str for field in self.fields},
+                                     chunksize=self.csv_chunk_size):
+                cards, failures = prepare_cards(chunk, self.fields, self.formats)
+                for failure in failures:
+                    key = chunk.at[failure.row, 'roll no.']
+                    if isinstance(key, str):
+                        seen.add(key)
+                        # Keep the card of the last good row rather than retiring it
+                        if key in manifest.previous and not manifest.reset:
+                            manifest.cards[key] = manifest.previous[key]
+                    counts['failed'] += 1
+                    errors.append((failure.name, failure.error))
+                for card in cards:
+                    key = card.texts[self.roll_index]
+                    seen.add(key)
+                    if key in rendered_keys:
+                        # Both rows would be saved to the same file
+                        counts['failed'] += 1
+                        errors.append((card.name, f"Duplicate roll number {key} (row {card.row + 2}), first row kept"))
+                        continue
+                    rendered_keys.add(key)
+                    digest = card_digest(card.texts, card.filename)
+                    if manifest.is_current(key, digest, existing_files, self.extension):
+                        counts['unchanged'] += 1
+                        continue
+                    counts['changed' if key in manifest.previous else 'added'] += 1
+                    digests[card.row] = (key, digest)
+                    batch_cards.append(card)
+                    if len(batch_cards) >= self.chunk_size:
+                        yield batch_cards
+                        batch_cards = []
+            if batch_cards:
+                yield batch_cards
+
+        def collect(done):
+            for future in done:
+                results, _, _ = future.result()
+                # Cards are only recorded once written; failed ones are retried with the next roster
+                for card, (success, student, error, size) in zip(pending.pop(future), results):
+                    key, digest = digests.pop(card.row)
+                    if success:
+                        path = card_path(card.filename, self.extension, self.output_layout)
+                        manifest.update(key, digest, card.filename, path, size)
+                    else:
+                        counts['failed'] += 1
+                        errors.append((student, error))
+
+        pending = {}
+        aborted = None
+        try:
+            for cards in changed_cards():
+                if len(pending) >= self.max_in_flight:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending[self.pool.submit(render_chunk, cards, output_dir)] = cards
+            collect(wait(pending).done)
+        except Exception as e:
+            # Not recorded as rendered: the roster is tried again later, a limited number of times
+            aborted = str(e)
+            wait(pending)
+            counts['failed'] += 1
+            errors.append((name, aborted))
+            if not manifest.reset:
+                # Students after the failure were not looked at: keep their cards, retire nothing
+                for key, entry in manifest.previous.items():
+                    manifest.cards.setdefault(key, entry)
+
+        if self.retire_removed and aborted is None:
+            retired_dir = os.path.join(output_dir, RETIRED_FOLDER)
+            for _, path in manifest.stale(seen, self.extension):
+                card_file = os.path.join(output_dir, path)
+                if os.path.exists(card_file):
+                    os.makedirs(retired_dir, exist_ok=True)
+                    os.replace(card_file, os.path.join(retired_dir, os.path.basename(path)))
+                    counts['retired'] += 1
+        manifest.save()
+
+        if aborted is None:
+            self.retries.pop(name, None)
+            self.state[batch] = name
+            self.save_state()
+        else:
+            attempts = self.retries.get(name, (0, 0))[0] + 1
+            self.retries[name] = (attempts, time.time() + self.poll_interval * 2 ** attempts)
+        print(f"{'✗' if aborted else '✓'} {name}: {counts['added']} added, {counts['changed']} changed, {counts['unchanged']} unchanged, "
+              f"{counts['retired']} retired, {counts['failed']} failed ({time.time() - start_time:.1f}s)")
+        for student, error in errors[:5]:
+            print(f"  - {student}: {error}")
+        if aborted is not None:
+            if attempts < READ_ATTEMPTS:
+                print(f"  Trying again in {self.poll_interval * 2 ** attempts:.1f}s (attempt {attempts + 1} of {READ_ATTEMPTS})")
+            else:
+                print(f"  Giving up after {READ_ATTEMPTS} attempts; upload a corrected roster")
+
+    def process(self, names):
+        for batch, name in self.pending_rosters(names):
+            try:
+                self.render_roster(batch, name)
+            except Exception as e:
+                print(f"✗ {name}: {e}")
+
+    def run(self):
+        """Render what is pending, then watch the folder until interrupted."""
+        os.makedirs(self.upload_dir, exist_ok=True)
+        os.makedirs(self.output_root, exist_ok=True)
+        self.load_state()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, initializer=init_process_worker,
+                                        initargs=(self.config, self.coordinates))
+        for future in [self.pool.submit(warm_up_worker, 0.2) for _ in range(self.workers)]:
+            future.result()
+
+        watch = None
+        if self.use_inotify and sys.platform.startswith('linux'):
+            try:
+                watch = InotifyWatch(self.upload_dir)
+            except OSError as e:
+                print(f"⚠ inotify unavailable ({e}), polling every {self.poll_interval}s")
+        print(f"✓ Watching {self.upload_dir} ({'inotify' if watch else 'polling'})")
+
+        try:
+            # Everything already in the folder is complete
+            self.process(os.listdir(self.upload_dir))
+            previous = {}
+            while True:
+                if watch is not None:
+                    self.process(watch.wait(self.poll_interval) + self.due_retries())
+                    continue
+                time.sleep(self.poll_interval)
+                current = {}
+                with os.scandir(self.upload_dir) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            stat = entry.stat()
+                            current[entry.name] = (stat.st_size, stat.st_mtime_ns)
+                # A file still being copied changes between polls
+                self.process([name for name, stamp in current.items() if previous.get(name) == stamp])
+                previous = current
+        except KeyboardInterrupt:
+            print("\nStopped watching")
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+
+
+if __name__ == "__main__":
+    UploadWatcher(upload_dir=sys.argv[1] if len(sys.argv) > 1 else None).run()